@@ -1,34 +1,98 @@
+import os
+import selectors
 import socket
-import struct
 import threading
-import queue
 
 from .utils import *
 
+from .batch_io import BatchReceiver, BufferPool
+from .spsc_ring import SPSCRing
 from .sender import Sender
 from .receiver import Receiver
 
+def _noop(*_args):
+    pass
+
 class ReliableUDP_API:
     """
     Implements a Selective Repeat protocol.
+
+    zero_copy=True delivers payloads as memoryviews into pooled receive
+    buffers instead of bytes copies; pass each one to release() when done
+    with it so its buffer is reused. Datagrams must fit RX_POOL_SLOT_SIZE.
+
+    connect=True connect()s the socket to the remote so sends skip the
+    address entirely. The kernel then drops datagrams from any other peer
+    and reports ICMP port-unreachable as send/receive errors, so only use
+    it when the remote is the endpoint's sole peer.
+
+    reuse_port=True sets SO_REUSEPORT so several processes can bind the
+    same port and let the kernel spread incoming flows across them.
+
+    gso=True sends runs of equal-size packets (fixed-size game state) as
+    one UDP GSO buffer each, which the kernel segments (Linux >= 4.18;
+    falls back to per-datagram sends elsewhere).
     """
 
-    def __init__(self, local_port, remote_host=None, remote_port=None):
+    def __init__(self, local_port, remote_host=None, remote_port=None, zero_copy=False, connect=False,
+                 reuse_port=False, gso=False):
         self.local_addr = ('0.0.0.0', local_port)
-        self.remote_addr = (remote_host, remote_port) if remote_host is not None and remote_port is not None else None
+        self.remote_addr = None
+        if remote_host is not None and remote_port is not None:
+            # Resolve once: sends then hand the kernel a numeric address
+            self.remote_addr = (socket.gethostbyname(remote_host), remote_port)
 
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if reuse_port:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.sock.bind(self.local_addr)
+        # Room for bursts: the ~200 KB defaults overflow and cost retransmits
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCK_RCVBUF)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCK_SNDBUF)
+        except OSError as e:
+            LOG.warning("API cannot resize socket buffers: %s", e)
+        self.sock.setblocking(False)
+        connected = connect and self.remote_addr is not None
+        if connected:
+            self.sock.connect(self.remote_addr)
 
-        # Delivery Queue for Application
-        self.delivery_queue = queue.Queue()
+        # Readiness: the UDP socket plus a wakeup pair that close() writes to
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._sel = selectors.DefaultSelector()
+        self._sel.register(self.sock, selectors.EVENT_READ)
+        self._sel.register(self._wakeup_r, selectors.EVENT_READ)
+
+        # Delivery ring for Application (IO thread produces, app consumes),
+        # holding (seq or None, ts_ms, payload) per message
+        self.delivery_queue = SPSCRing()
 
         # Threading Control
-        self.lock = threading.Lock()
+        # Receiver state is touched only by io_thread, so it needs no lock.
+        # Sender state is shared by app send(), io_thread SACKs and timers.
+        self._tx_lock = threading.Lock()
         self.stop_event = threading.Event()
 
-        self._receiver = Receiver(self.sock, self.delivery_queue, self.lock)
-        self._sender = Sender(self.sock, self.remote_addr, self.lock) if self.remote_addr else None
+        self._rx_pool = BufferPool() if zero_copy else None
+        self._receiver = Receiver(self.sock, self.delivery_queue, self._rx_pool)
+        self._sender = Sender(self.sock, self.remote_addr, self._tx_lock, connected=connected,
+                              gso=gso) if self.remote_addr else None
+        self._batch_rx = BatchReceiver(self.sock, pool=self._rx_pool)
+
+        self._unpack_hdr = HDR_STRUCT.unpack_from
+
+        # Channel demux table; every handler takes (seq, ts_ms, payload, addr)
+        # and, with zero_copy, owns the payload's buffer from then on.
+        self._drop = _noop if self._rx_pool is None else self._drop_pooled
+        # SACKs are collected per receive batch and applied in one go
+        self._acks = []
+        ack_handler = self._collect_sack if self._sender is not None else self._drop
+        self._dispatch = {
+            DATA_CHANNEL: self._receiver.handle_reliable,
+            ACK_CHANNEL: ack_handler,
+            UNREL_CHANNEL: self._receiver.handle_unreliable,
+        }
 
         self.io_thread = threading.Thread(target=self._io_loop, daemon=True)
         self.io_thread.start()
@@ -41,48 +105,91 @@ class ReliableUDP_API:
         Receives all incoming packets, demultiplexes channels, and
         drives the receiver's hole-skip via adaptive timeouts.
         """
+        self._pin_io_thread()
+
         while not self.stop_event.is_set():
 
             now_ms = now_ms32()
-            timeout = compute_recv_timeout_sec(now_ms, self._receiver.skip_deadline_ms)
+            timeout = min(compute_recv_timeout_sec(now_ms, self._receiver.skip_deadline_ms),
+                          compute_recv_timeout_sec(now_ms, self._receiver.sack_due_ms))
 
             try:
-                self.sock.settimeout(timeout)
-                packet, sender_addr = self.sock.recvfrom(64 * 1024)
-
-                if len(packet) < HEADER_SIZE:
+                events = self._sel.select(timeout)
+                if not events:
+                    # Nothing arrived for 'timeout': drive the hole-skip
+                    # and send any SACK held back for coalescing
+                    now_ms = now_ms32()
+                    self._receiver.on_idle(now_ms)
+                    self._receiver.flush_sack(now_ms)
                     continue
+                if any(key.fileobj is self._wakeup_r for key, _mask in events):
+                    break  # close() wants us out
+
+                # Non-blocking drain of up to one batch of queued datagrams
+                for packet, sender_addr in self._batch_rx.recv_batch():
+                    self._dispatch_packet(packet, sender_addr)
+                if self._acks:
+                    self._apply_sacks()
+                # Coalesce: a single SACK acknowledges the whole batch
+                self._receiver.flush_sack(now_ms32())
 
-                channel_type, seq, timestamp, payload = unpack_header(packet)
-
-                if channel_type == DATA_CHANNEL:
-                    self._receiver.handle_reliable(packet, sender_addr)
-                elif channel_type == ACK_CHANNEL:
-                    if self._sender is not None:
-                        # --- THIS IS THE CHANGE ---
-                        # Pass the whole packet for SACK processing
-                        self._sender.handle_sack(packet)
-                elif channel_type == UNREL_CHANNEL:
-                    self._receiver.handle_unreliable(packet)
-                    # No need to continue, loop will restart
-                else:
-                    # Unknown channel, ignore
-                    pass
-
-            except socket.timeout:
-                self._receiver.on_idle(now_ms32())
             except OSError as e:
-                # 11 = EWOULDBLOCK / EAGAIN (common on non-blocking, but we use timeout)
                 if self.stop_event.is_set():
                     break # Exit loop if we are closing
-                if e.errno == 11:
-                    # nothing to read, just idle
-                    self._receiver.on_idle(now_ms32())
-                else:
-                    print(f"API Receive error: {e}")
+                LOG.warning("API Receive error: %s", e)
             except Exception as e:
                 if not self.stop_event.is_set():
-                    print(f"API unhandled error in _io_loop: {e}")
+                    LOG.warning("API unhandled error in _io_loop: %s", e)
+
+    def _pin_io_thread(self):
+        """
+        Pin io_thread to the CPU core named by $RUDP_IO_CORE (Linux only).
+        Keeps receive-ring and ACK state in one core's cache when the game
+        thread is busy. Opt-in: nothing happens if the variable is unset.
+        """
+        core = os.environ.get('RUDP_IO_CORE')
+        if core is None or not hasattr(os, 'sched_setaffinity'):
+            return
+        try:
+            # pid 0 = the calling thread on Linux
+            os.sched_setaffinity(0, {int(core)})
+        except (ValueError, OSError) as e:
+            LOG.warning("API cannot pin io_thread to core %r: %s", core, e)
+
+    def _dispatch_packet(self, packet, sender_addr):
+        """
+        Demultiplexes one datagram onto its channel handler.
+        packet is a view into the batch receive buffer; handlers copy
+        whatever they keep (or, with zero_copy, keep or release the view).
+        """
+        if len(packet) < HEADER_SIZE:
+            self._drop(None, None, packet, sender_addr)
+            return
+
+        # Header is parsed exactly once here; handlers get the fields.
+        # Unknown channels (and ACKs on a receiver-only endpoint) are ignored.
+        # Same as unpack_header, inlined: packet is already a memoryview.
+        channel_type, seq, timestamp = self._unpack_hdr(packet, 0)
+        payload = packet[HEADER_SIZE:]
+        self._dispatch.get(channel_type, self._drop)(seq, timestamp, payload, sender_addr)
+
+    def _drop_pooled(self, _seq, _ts_ms, payload, _sender_addr=None):
+        self._rx_pool.release(payload)
+
+    def _collect_sack(self, _seq, ts_ms, payload, _sender_addr=None):
+        self._acks.append((ts_ms, payload))
+
+    def _apply_sacks(self):
+        """Hand the batch's SACKs to the sender: one lock acquisition in total."""
+        acks = self._acks
+        try:
+            self._sender.handle_sacks(acks)
+        finally:
+            if self._rx_pool is not None:
+                # The sender only parses SACKs, so their buffers are free now
+                for _ts_ms, payload in acks:
+                    self._rx_pool.release(payload)
+            acks.clear()
 
     # ----------------------------------------------------------------------
     # Public API
@@ -92,6 +199,8 @@ class ReliableUDP_API:
         Send data to the remote peer.
         - reliable=True: goes via the reliable channel (SR with retransmission).
         - reliable=False: goes via the unreliable channel (best-effort).
+        Raises OverflowError when a reliable send finds both the window and
+        the backlog behind it (4x the window) full.
         """
         if self._sender is None:
             raise RuntimeError("API has no remote; cannot send from a receiver-only endpoint.")
@@ -100,22 +209,41 @@ class ReliableUDP_API:
         else:
             self._sender.send_unreliable(data)
     
-    def receive(self):
+    def receive(self, timeout: float | None = 0.0):
         """
-        Non-blocking read from the delivery queue.
+        Read from the delivery ring.
+        - timeout=0 (default): non-blocking, for polling from a game loop.
+        - timeout>0: wait up to that many seconds for a message.
+        - timeout=None: wait until a message arrives or close() is called.
         Returns:
           - (seq, ts_ms, payload, latency) for reliable channel
           - (None, ts_ms, payload, latency) for unreliable channel
           or None if no message is available.
+        latency is measured here, so it includes the time spent queued.
         """
-        try:
-            return self.delivery_queue.get_nowait()
-        except queue.Empty:
+        item = self.delivery_queue.pop(timeout)
+        if item is None:
             return None
+        # The ring holds (seq, ts_ms, payload); latency is only worked out on read
+        seq, ts_ms, payload = item
+        return seq, ts_ms, payload, calc_latency_ms(ts_ms)
+
+    def release(self, payload):
+        """
+        Hand a zero_copy payload back to the receive pool once the app is
+        done with it. Optional: a payload never released is garbage collected.
+        Does nothing when the API was created without zero_copy.
+        """
+        if self._rx_pool is not None:
+            self._rx_pool.release(payload)
 
     def close(self):
-        """Shuts down the API."""
-        print("Closing API... stopping threads...")
+        """
+        Shuts down the API. Packets already queued for the wire go out
+        first (up to CLOSE_DRAIN_MS); reliable payloads still waiting for
+        window space are dropped. Later send() calls raise RuntimeError.
+        """
+        LOG.info("Closing API... stopping threads...")
         self.stop_event.set()
         
         if self._sender is not None:
@@ -124,20 +252,22 @@ class ReliableUDP_API:
             except Exception:
                 pass
 
-        # Nudge the socket to close to unblock recvfrom
-        # This is a bit of a hack, but effective
+        # Wake the selector so the IO loop exits right away
         try:
-            dummy_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            dummy_sock.sendto(b'close', self.local_addr)
-            dummy_sock.close()
-        except Exception:
+            self._wakeup_w.send(b'\0')
+        except OSError:
             pass
 
         try:
             self.io_thread.join(timeout=1.0)
         except RuntimeError:
             pass
+        # Release an application thread blocked in receive()
+        self.delivery_queue.wake()
 
+        self._sel.close()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
         self.sock.close()
-        print("API closed.")
+        LOG.info("API closed.")
 
@@ -30,6 +30,9 @@ PPS="${PPS:-100}"                # overall packet rate (packets per second)
 DURATION="${DURATION:-100}"      # receiver runtime seconds
 # ---------------------------------------------------------
 
+# Run from the repo root so the heredocs below import 'api' as a package
+cd "$(dirname "$0")/.."
+
 TC=$(command -v tc || true)
 SUDO=""
 if [[ $EUID -ne 0 ]]; then
@@ -54,7 +57,7 @@ trap cleanup EXIT
 # Start receiver (background)
 echo "[STEP] starting receiver on 0.0.0.0:${RPORT} ..."
 python3 - <<PY & 
-from ReliableUDP_API import ReliableUDP_API
+from api.ReliableUDP_API import ReliableUDP_API
 import time, sys
 api = ReliableUDP_API(local_port=${RPORT})
 print("[Receiver] up on :${RPORT}")
@@ -89,7 +92,7 @@ fi
 # Sender: send reliable and unreliable packets interleaved
 echo "[STEP] starting sender from :${SPORT} -> ${REMOTE_HOST}:${REMOTE_PORT}"
 python3 - <<PY
-from ReliableUDP_API import ReliableUDP_API
+from api.ReliableUDP_API import ReliableUDP_API
 import time, math, sys
 api = ReliableUDP_API(local_port=${SPORT}, remote_host="${REMOTE_HOST}", remote_port=${REMOTE_PORT})
 print("[Sender] up, sending reliable + unreliable")
@@ -0,0 +1,369 @@
+import ctypes
+import ctypes.util
+import errno
+import select
+import socket
+import struct
+import sys
+
+from .utils import *
+
+# Largest UDP datagram we accept, same as the plain recvfrom path
+RECV_SLOT_SIZE = 64 * 1024
+# sockaddr_in: family (2, native), port (2, network order), IPv4 addr (4), zero pad (8)
+SOCKADDR_IN_SIZE = 16
+_SOCKADDR_IN = struct.Struct('!2xH4s')
+_SA_FAMILY = struct.Struct('=H')
+
+_MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0)
+
+# UDP generic segmentation offload (Linux >= 4.18): one sendmsg carries a
+# buffer of equal-size segments (the last may be shorter) that the kernel,
+# or the NIC, splits into datagrams. Limits from <linux/udp.h>.
+_UDP_SEGMENT = getattr(socket, 'UDP_SEGMENT', 103)
+_GSO_MAX_SEGS = 64            # UDP_MAX_SEGMENTS
+_GSO_MAX_BYTES = 65507        # one IPv4 UDP payload
+_GSO_SIZE = struct.Struct('=H')
+# What a kernel or device without UDP GSO answers with
+_GSO_UNSUPPORTED = (errno.EINVAL, errno.ENOPROTOOPT, errno.EOPNOTSUPP, errno.EIO)
+
+# ----------------------------------------------------------------------
+# ctypes mirrors of <sys/socket.h> / <sys/uio.h> (Linux layout)
+# ----------------------------------------------------------------------
+class _iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p),
+                ("iov_len", ctypes.c_size_t)]
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p),
+                ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(_iovec)),
+                ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p),
+                ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _msghdr),
+                ("msg_len", ctypes.c_uint)]
+
+def _load_libc_fn(name: str, argtypes):
+    """Return a libc function, or None where it does not exist (macOS/Windows)."""
+    if not _MSG_DONTWAIT:
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fn = getattr(libc, name)
+    except (OSError, AttributeError, TypeError):
+        return None
+    fn.argtypes = argtypes
+    fn.restype = ctypes.c_int
+    return fn
+
+_recvmmsg = _load_libc_fn('recvmmsg', [ctypes.c_int, ctypes.POINTER(_mmsghdr), ctypes.c_uint,
+                                       ctypes.c_int, ctypes.c_void_p])
+_sendmmsg = _load_libc_fn('sendmmsg', [ctypes.c_int, ctypes.POINTER(_mmsghdr), ctypes.c_uint,
+                                       ctypes.c_int])
+
+def _buffer_address(buf) -> int:
+    """Address of the first byte of a bytes or writable buffer (no copy)."""
+    if isinstance(buf, bytes):
+        return ctypes.cast(ctypes.c_char_p(buf), ctypes.c_void_p).value
+    return ctypes.addressof((ctypes.c_char * len(buf)).from_buffer(buf))
+
+
+class BufferPool:
+    """
+    Free-list of fixed-size receive buffers, the provided-buffer half of a
+    multishot recv: each datagram lands in its own buffer, which travels to
+    the application untouched and comes back here through release().
+
+    acquire() allocates a fresh buffer when the list is empty, so a buffer
+    that is never released is simply garbage collected. list.pop/append are
+    atomic under the GIL, so the IO and application threads may both call in.
+    """
+
+    def __init__(self, slot_size: int = RX_POOL_SLOT_SIZE, count: int = RX_POOL_SIZE):
+        self.slot_size = slot_size
+        self.count = count
+        self._free = [bytearray(slot_size) for _ in range(count)]
+
+    def acquire(self) -> bytearray:
+        try:
+            return self._free.pop()
+        except IndexError:  # empty, possibly emptied by another caller just now
+            return bytearray(self.slot_size)
+
+    def release(self, buf):
+        """Return a buffer, or any memoryview into one, to the free-list."""
+        if isinstance(buf, memoryview):
+            buf = buf.obj
+        if (isinstance(buf, bytearray) and len(buf) == self.slot_size
+                and len(self._free) < self.count):
+            self._free.append(buf)
+
+
+class BatchReceiver:
+    """
+    Reads datagrams from a non-blocking UDP socket in batches, once the
+    caller's selector reports it readable.
+    The first datagram comes from recvfrom_into; whatever is already
+    queued behind it is drained with a single recvmmsg(2) call.
+    Falls back to one recvfrom_into per call when recvmmsg is unavailable.
+
+    Without a pool, all datagrams land in buffers allocated once here and
+    recv_batch returns memoryviews into them, valid only until the next call.
+    With a BufferPool, every datagram gets a buffer of its own; the views stay
+    valid until their owner hands them back with pool.release(). Datagrams
+    larger than the pool's slot size are dropped.
+    """
+
+    def __init__(self, sock, batch_size: int = MAX_BATCH_SIZE, pool: BufferPool = None):
+        self.sock = sock
+        self.batch_size = batch_size
+        self.fd = sock.fileno()
+        self.pool = pool
+        self._recvmmsg = _recvmmsg if batch_size > 1 else None
+        slot_size = pool.slot_size if pool is not None else RECV_SLOT_SIZE
+        self._slot_size = slot_size
+
+        # Landing buffer for the first read of each batch
+        self._rxbuf = pool.acquire() if pool is not None else bytearray(RECV_SLOT_SIZE)
+        self._rxmv = memoryview(self._rxbuf)
+        # recvmsg_into reports MSG_TRUNC, which a pool's small slots need
+        self._use_recvmsg = pool is not None and hasattr(sock, 'recvmsg_into')
+
+        if self._recvmmsg is not None:
+            n = batch_size - 1  # the first datagram is read by recvfrom
+            # One iovec and one sockaddr per slot
+            self._names = ctypes.create_string_buffer(n * SOCKADDR_IN_SIZE)
+            self._names_mv = memoryview(self._names).cast('B')
+            self._iovs = (_iovec * n)()
+            self._hdrs = (_mmsghdr * n)()
+
+            names_addr = ctypes.addressof(self._names)
+            for i in range(n):
+                hdr = self._hdrs[i].msg_hdr
+                hdr.msg_name = names_addr + i * SOCKADDR_IN_SIZE
+                hdr.msg_namelen = SOCKADDR_IN_SIZE
+                hdr.msg_iov = ctypes.pointer(self._iovs[i])
+                hdr.msg_iovlen = 1
+
+            if pool is None:
+                # One slab of fixed-size slots, reused by every call
+                self._slab = ctypes.create_string_buffer(n * RECV_SLOT_SIZE)
+                self._slab_mv = memoryview(self._slab).cast('B')
+                slab_addr = ctypes.addressof(self._slab)
+                for i in range(n):
+                    self._iovs[i].iov_base = slab_addr + i * RECV_SLOT_SIZE
+                    self._iovs[i].iov_len = RECV_SLOT_SIZE
+            else:
+                # Each slot is bound to a pool buffer, swapped once it is handed out
+                self._bound = [None] * n
+                for i in range(n):
+                    self._bind_slot(i, pool.acquire())
+
+    def _bind_slot(self, i: int, buf: bytearray):
+        self._bound[i] = buf
+        self._iovs[i].iov_base = _buffer_address(buf)
+        self._iovs[i].iov_len = len(buf)
+
+    def _recv_first(self):
+        """Read one datagram into _rxbuf. Returns (nbytes, addr, truncated)."""
+        if self._use_recvmsg:
+            nbytes, _anc, flags, sender_addr = self.sock.recvmsg_into([self._rxbuf])
+            return nbytes, sender_addr, flags & socket.MSG_TRUNC
+        nbytes, sender_addr = self.sock.recvfrom_into(self._rxbuf)
+        return nbytes, sender_addr, False
+
+    def recv_batch(self) -> list:
+        """
+        Non-blocking read of up to batch_size queued datagrams.
+        Returns a list of (packet_view, sender_addr), empty if nothing was
+        queued. Without a pool the views are overwritten by the next call,
+        so copy anything that must outlive it. Other errors raise OSError
+        like sock.recvfrom.
+        """
+        try:
+            nbytes, sender_addr, truncated = self._recv_first()
+        except BlockingIOError:
+            return []
+
+        pool = self.pool
+        packets = []
+        if truncated:
+            LOG.warning("API dropped a datagram larger than %d bytes", self._slot_size)
+        else:
+            packets.append((self._rxmv[:nbytes], sender_addr))
+            if pool is not None:
+                # The datagram keeps this buffer; land the next one elsewhere
+                self._rxbuf = pool.acquire()
+                self._rxmv = memoryview(self._rxbuf)
+        if self._recvmmsg is None:
+            return packets
+
+        hdrs = self._hdrs
+        for i in range(self.batch_size - 1):
+            hdrs[i].msg_hdr.msg_namelen = SOCKADDR_IN_SIZE
+
+        cnt = self._recvmmsg(self.fd, hdrs, self.batch_size - 1, _MSG_DONTWAIT, None)
+        # cnt == -1 is EAGAIN in the common case: nothing else is queued
+        for i in range(max(cnt, 0)):
+            length = hdrs[i].msg_len
+            if pool is None:
+                off = i * RECV_SLOT_SIZE
+                packet = self._slab_mv[off:off + length]
+            elif hdrs[i].msg_hdr.msg_flags & socket.MSG_TRUNC:
+                LOG.warning("API dropped a datagram larger than %d bytes", self._slot_size)
+                continue  # keep the slot's buffer bound for the next call
+            else:
+                packet = memoryview(self._bound[i])[:length]
+                self._bind_slot(i, pool.acquire())
+            port, ip = _SOCKADDR_IN.unpack_from(self._names_mv, i * SOCKADDR_IN_SIZE)
+            packets.append((packet, (socket.inet_ntoa(ip), port)))
+        return packets
+
+
+class BatchSender:
+    """
+    Sends a list of datagrams to one address with a single sendmmsg(2).
+    Falls back to one sendto per datagram when sendmmsg is unavailable,
+    for single datagrams, and for whatever the kernel did not accept.
+    The socket is non-blocking: on a full send buffer (EAGAIN) it waits,
+    up to SEND_WAIT_MS at a time, for the socket to become writable and
+    sends the rest, so nothing is dropped while the kernel catches up.
+    With connected=True the socket is connect()ed: no address is encoded
+    and the fallback is a plain send.
+    With gso=True (Linux only), runs of two or more equal-size datagrams
+    are handed to the kernel as one UDP_SEGMENT sendmsg; if the kernel
+    refuses, GSO is switched off and everything goes the plain way.
+    """
+
+    def __init__(self, sock, batch_size: int = MAX_BATCH_SIZE, connected: bool = False,
+                 gso: bool = False):
+        self.sock = sock
+        self._sendto = sock.sendto
+        self._send = sock.send
+        self.connected = connected
+        self.gso = gso and sys.platform.startswith('linux') and hasattr(sock, 'sendmsg')
+        self.batch_size = batch_size
+        self.fd = sock.fileno()
+        self._sendmmsg = _sendmmsg if batch_size > 1 else None
+        self._addr = None
+        # Waits for send-buffer room. poll has no FD_SETSIZE cap on the fd
+        # number; Windows lacks it, but its select takes any socket.
+        self._poller = None
+        if hasattr(select, 'poll'):
+            self._poller = select.poll()
+            self._poller.register(self.fd, select.POLLOUT)
+
+        if self._sendmmsg is not None:
+            self._name = ctypes.create_string_buffer(SOCKADDR_IN_SIZE)
+            self._iovs = (_iovec * batch_size)()
+            self._hdrs = (_mmsghdr * batch_size)()
+            name_addr = ctypes.addressof(self._name)
+            for i in range(batch_size):
+                hdr = self._hdrs[i].msg_hdr
+                if not connected:
+                    hdr.msg_name = name_addr
+                    hdr.msg_namelen = SOCKADDR_IN_SIZE
+                hdr.msg_iov = ctypes.pointer(self._iovs[i])
+                hdr.msg_iovlen = 1
+
+    def _set_addr(self, addr):
+        """Encode addr into the shared sockaddr_in (cached while it is unchanged)."""
+        if addr == self._addr:
+            return
+        ip = socket.inet_aton(socket.gethostbyname(addr[0]))
+        _SOCKADDR_IN.pack_into(self._name, 0, addr[1], ip)
+        _SA_FAMILY.pack_into(self._name, 0, socket.AF_INET)  # after: '2x' zeroes it
+        self._addr = addr
+
+    def send_batch(self, packets: list, addr):
+        """Send every packet in order. Raises OSError like sock.sendto."""
+        if not self.gso:
+            self._send_plain(packets, addr)
+            return
+        n = len(packets)
+        done = 0   # packets[:done] are sent
+        i = 0
+        while i < n:
+            # Extend a run of equal-size packets, plus at most one shorter tail
+            size = len(packets[i])
+            limit = min(n, i + _GSO_MAX_SEGS, i + _GSO_MAX_BYTES // size) if size else i + 1
+            j = i + 1
+            while j < limit and len(packets[j]) == size:
+                j += 1
+            if j < limit and len(packets[j]) < size:
+                j += 1
+            if j - i > 1:
+                if done < i:
+                    self._send_plain(packets[done:i], addr)
+                self._send_gso(packets[i:j], size, addr)
+                done = j
+            i = j
+        if done < n:
+            self._send_plain(packets[done:], addr)
+
+    def _send_gso(self, segments: list, size: int, addr):
+        """One sendmsg for segments, which the kernel splits every size bytes."""
+        anc = [(socket.IPPROTO_UDP, _UDP_SEGMENT, _GSO_SIZE.pack(size))]
+        buf = [b''.join(segments)]
+        try:
+            while True:
+                try:
+                    if self.connected:
+                        self.sock.sendmsg(buf, anc)
+                    else:
+                        self.sock.sendmsg(buf, anc, 0, addr)
+                    return
+                except BlockingIOError:
+                    self._wait_writable()
+        except OSError as e:
+            if e.errno not in _GSO_UNSUPPORTED:
+                raise
+            LOG.warning("API UDP GSO unavailable (%s); sending datagrams one by one", e)
+            self.gso = False
+            self._send_plain(segments, addr)
+
+    def _send_plain(self, packets: list, addr):
+        """sendmmsg in batch_size chunks, then sendto/send for the remainder."""
+        sent = 0
+        if self._sendmmsg is not None and len(packets) > 1:
+            if not self.connected:
+                self._set_addr(addr)
+            while len(packets) - sent > 1:
+                chunk = packets[sent:sent + self.batch_size]
+                for i, pkt in enumerate(chunk):
+                    self._iovs[i].iov_base = _buffer_address(pkt)
+                    self._iovs[i].iov_len = len(pkt)
+                cnt = self._sendmmsg(self.fd, self._hdrs, len(chunk), 0)
+                if cnt <= 0:
+                    if ctypes.get_errno() != errno.EAGAIN:
+                        break  # let sendto below surface the error
+                    self._wait_writable()
+                    continue
+                sent += cnt
+
+        n = len(packets)
+        connected = self.connected
+        send = self._send
+        sendto = self._sendto
+        while sent < n:
+            try:
+                if connected:
+                    send(packets[sent])
+                else:
+                    sendto(packets[sent], addr)
+                sent += 1
+            except BlockingIOError:
+                self._wait_writable()
+
+    def _wait_writable(self):
+        """Block until the send buffer has room; raises if it stays full."""
+        if self._poller is not None:
+            ready = self._poller.poll(SEND_WAIT_MS)
+        else:
+            ready = select.select((), (self.fd,), (), SEND_WAIT_MS / 1000)[1]
+        if not ready:
+            raise BlockingIOError(errno.EAGAIN, "send buffer full for %d ms" % SEND_WAIT_MS)
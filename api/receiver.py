@@ -1,8 +1,5 @@
-import struct
-import queue
-import socket
-
-from functools import cmp_to_key
+import array
+import logging
 
 from .utils import *
 
@@ -12,23 +9,57 @@ class Receiver:
     Handles:
       - Reliable channel: buffering, in-order delivery, selective skip (hole-jump)
       - Unreliable channel: immediate delivery
+    All methods run on the API's io_thread only, so no lock is taken.
     """
 
-    def __init__(self, sock, delivery_queue, lock):
+    def __init__(self, sock, delivery_queue, pool=None):
         self.sock = sock
         self.delivery_queue = delivery_queue
-        self.lock = lock
+        # zero_copy: payloads are pooled views kept as-is (the app releases
+        # them); dropped packets hand their buffer straight back to the pool.
+        # Otherwise payloads are views into a scratch buffer and get copied.
+        self._pool = pool
 
         # --- Reliable reception state ---
         self.next_expected_seq_num = 0
-        self.receive_buffer = {}          # seq -> (payload_bytes, timestamp_ms)
+        # Reordering buffer: a ring indexed by seq & RECV_MASK. Only seqs in
+        # [next_expected, next_expected + RECV_WIN) are stored, so a slot
+        # never holds two live sequence numbers.
+        # Parallel per-slot arrays, so storing a packet allocates no tuple.
+        self.recv_payloads = [None] * RECV_WIN  # idx -> payload
+        self.recv_ts = array.array('I', bytes(4 * RECV_WIN))  # idx -> timestamp_ms
+        self.recv_present = bytearray(RECV_WIN) # idx -> 1 if slot holds an undelivered packet
+        self.recv_count = 0                     # number of present slots
+        # The buffered seqs as maximal runs [start, end] (inclusive), ordered
+        # by distance from next_expected. Kept up to date on every insert and
+        # delivery, so a SACK just encodes the runs from its bitmap base.
+        self.sack_ivs = []
+        # Where the next SACK bitmap starts. Each SACK covers the
+        # SACK_BITMAP_BITS seqs after the previous one, wrapping back to the
+        # front, so a few SACKs in a row report the whole buffer.
+        self._sack_cursor = 0
         self.skip_deadline_ms = None      # timestamp (ms) for hole-skip timeout
+        # Peer whose in-order data is held back because the delivery ring
+        # was full; on_idle retries delivery and owes it a SACK on progress
+        self._held_peer = None
 
         self.skip_time = SKIP_TIMEOUT_MS
         self.last_arrival_ms = None
         self.iat_ewma_ms = 0.0
 
-        print(f"API (Receiver) listening on {self.sock.getsockname()}")
+        # Reusable SACK frame: header (channel + dummy seq 0 + ts) + SACK body.
+        # Channel and seq are stamped once here; each ACK only rewrites the
+        # timestamp and the body in place. sendto copies it synchronously.
+        self._ack_buf = bytearray(HEADER_SIZE + SACK_PAYLOAD_SIZE)
+        HDR_STRUCT.pack_into(self._ack_buf, 0, ACK_CHANNEL, 0, 0)
+        self._sack_addr = None            # peer owed a SACK since the last flush
+        self._sack_urgent = False         # owed SACK must go out at the next flush
+        self.sack_due_ms = None           # latest time the owed SACK may be sent
+        # Bound once; both run for every SACK
+        self._sendto = sock.sendto
+        self._pack_ts_into = TS_STRUCT.pack_into
+
+        LOG.info("API (Receiver) listening on %s", self.sock.getsockname())
 
     # ----------------------------------------------------------------------
     # Core delivery helpers
@@ -39,71 +70,95 @@ class Receiver:
         starting from 'next_expected_seq_num'.
         If any were delivered, clear the skip deadline because
         the gap has been filled or bypassed.
+        Only as many as the delivery ring has room for are handed over;
+        the rest stay buffered, and next_expected (so the cum_ack) stops
+        there until the app catches up.
         """
-        progressed = False
-        while self.next_expected_seq_num in self.receive_buffer:
-            payload, ts_ms = self.receive_buffer.pop(self.next_expected_seq_num)
-            latency = calc_latency_ms(ts_ms)
-            self.delivery_queue.put((self.next_expected_seq_num, ts_ms, payload, latency))
-            self.next_expected_seq_num = seq_inc(self.next_expected_seq_num)
-            progressed = True
-
-        if progressed:
-            self.skip_deadline_ms = None  # reset skip timer when sequence advances
+        present = self.recv_present
+        nxt = self.next_expected_seq_num
+        idx = nxt & RECV_MASK
+        if not present[idx]:
+            return
+        room = self.delivery_queue.space()
+        if not room:
+            return
+        # Bound once: this loop runs per delivered packet
+        payloads = self.recv_payloads
+        stamps = self.recv_ts
+        delivered = []
+        add = delivered.append
+        while present[idx] and room:
+            add((nxt, stamps[idx], payloads[idx]))
+            payloads[idx] = None
+            present[idx] = 0
+            nxt = (nxt + 1) & SEQ_MASK
+            idx = nxt & RECV_MASK
+            room -= 1
+        # The run starting at next_expected is the first interval: it is
+        # either delivered whole or now starts where delivery stopped
+        if present[idx]:
+            self.sack_ivs[0][0] = nxt
+        else:
+            del self.sack_ivs[0]
+        # Hand the whole run to the app at once: one publish, one wakeup
+        self.delivery_queue.put_many(delivered)
+        self.recv_count -= len(delivered)
+        self.next_expected_seq_num = nxt
+        self.skip_deadline_ms = None  # reset skip timer when sequence advances
 
     # ----------------------------------------------------------------------
     # SACK generation helper
     # ----------------------------------------------------------------------
-    def _get_sack_blocks(self) -> list:
-        """
-        Analyzes the buffer to generate a list of contiguous received blocks
-        that are *after* the next_expected_seq_num.
-        Returns a list of (start_seq, end_seq_inclusive) tuples.
-        """
-        if not self.receive_buffer:
-            return []
-
-        # Create a comparison function that sorts based on distance from next_expected
-        def compare_seq(a, b):
-            a_dist = (a - self.next_expected_seq_num) & SEQ_MASK
-            b_dist = (b - self.next_expected_seq_num) & SEQ_MASK
-            return a_dist - b_dist
-
-        # Sort keys based on their sequence order *after* the cumulative ACK point
-        sorted_keys = sorted(self.receive_buffer.keys(), key=cmp_to_key(compare_seq))
-
-        sack_blocks = []
-        start_of_block = None
-        current_seq_in_block = None
-
-        for seq in sorted_keys:
-            # Skip any sequences that are at or before the cumulative ACK point
-            if not is_seq_less_than(self.next_expected_seq_num, seq):
-                continue
-
-            if start_of_block is None:
-                start_of_block = seq
-            if current_seq_in_block is None:
-                current_seq_in_block = seq
-            elif seq == seq_inc(current_seq_in_block):
-                # This sequence is contiguous, extend the block
-                current_seq_in_block = seq
+    def _sack_insert(self, seq: int):
+        """
+        Add a newly buffered seq to sack_ivs, extending or merging the
+        neighbouring runs. Scans from the tail, since in-order arrivals
+        behind a hole extend the last run.
+        """
+        ivs = self.sack_ivs
+        nxt = self.next_expected_seq_num
+        off = (seq - nxt) & SEQ_MASK
+        # seq is not buffered, so no run contains it: find the first run past it
+        i = len(ivs)
+        while i and ((ivs[i - 1][0] - nxt) & SEQ_MASK) > off:
+            i -= 1
+        nxt_seq = (seq + 1) & SEQ_MASK
+        joins_right = i < len(ivs) and ivs[i][0] == nxt_seq
+        if i and ((ivs[i - 1][1] + 1) & SEQ_MASK) == seq:
+            left = ivs[i - 1]
+            if joins_right:
+                left[1] = ivs[i][1]
+                del ivs[i]       # seq filled the hole between two runs
             else:
-                # Gap detected. Close the previous block.
-                sack_blocks.append((start_of_block, current_seq_in_block))
-                if len(sack_blocks) >= MAX_SACK_BLOCKS:
-                    return sack_blocks # Stop if we've filled our SACK blocks
-
-                # Start a new block
-                start_of_block = seq
-                current_seq_in_block = seq
-
-        # Close the last open block, if any
-        if start_of_block is not None:
-            sack_blocks.append((start_of_block, current_seq_in_block))
-
-        return sack_blocks[:MAX_SACK_BLOCKS]
+                left[1] = seq
+        elif joins_right:
+            ivs[i][0] = seq
+        else:
+            ivs.insert(i, [seq, seq])
 
+    def _get_sack_bitmap(self) -> tuple:
+        """
+        Contiguous received blocks *after* the next_expected_seq_num, as a
+        (base, bitmap) pair covering SACK_BITMAP_BITS seqs. base is the first
+        buffered seq at or past _sack_cursor, or the nearest one once the
+        cursor has gone past every run or fallen behind next_expected.
+        """
+        ivs = self.sack_ivs
+        nxt = self.next_expected_seq_num
+        if not ivs:
+            self._sack_cursor = nxt  # keep the cursor moving with next_expected
+            return 0, 0
+        cursor = (self._sack_cursor - nxt) & SEQ_MASK
+        i = 0
+        if cursor < RECV_WIN:
+            while i < len(ivs) and ((ivs[i][1] - nxt) & SEQ_MASK) < cursor:
+                i += 1
+        if cursor >= RECV_WIN or i == len(ivs):
+            i, cursor = 0, 0  # past the last run, or stale: restart at the front
+        base = (nxt + max(cursor, (ivs[i][0] - nxt) & SEQ_MASK)) & SEQ_MASK
+        self._sack_cursor = (base + SACK_BITMAP_BITS) & SEQ_MASK
+        # At most SACK_BITMAP_BITS runs can start inside the bitmap
+        return base, sack_bitmap(ivs[i:i + SACK_BITMAP_BITS], base)
 
     # ----------------------------------------------------------------------
     # Send SACK
@@ -111,18 +166,51 @@ class Receiver:
     def _send_sack(self, sender_addr):
         """
         Generates and sends a SACK packet containing the cumulative ACK
-        and all available SACK blocks from the buffer.
+        and the SACK bitmap of the buffered runs nearest the front.
         """
         cum_ack = self.next_expected_seq_num
-        sack_blocks = self._get_sack_blocks()
+        base, bitmap = self._get_sack_bitmap()
 
         try:
-            sack_payload = pack_sack(cum_ack, sack_blocks) 
-            # Use seq=0 in header as a dummy, channel is ACK_CHANNEL
-            ack_pkt = pack_header(ACK_CHANNEL, 0, now_ms32()) + sack_payload
-            self.sock.sendto(ack_pkt, sender_addr)
+            ack_buf = self._ack_buf
+            # Header already holds ACK_CHANNEL and the dummy seq=0
+            self._pack_ts_into(ack_buf, TS_OFFSET, now_ms32())
+            pack_sack_into(ack_buf, HEADER_SIZE, cum_ack, base, bitmap)
+            self._sendto(ack_buf, sender_addr)
         except Exception as e:
-            print(f"API (Receiver) SACK send error (cum_ack={cum_ack}): {e}")
+            LOG.warning("API (Receiver) SACK send error (cum_ack=%d): %s", cum_ack, e)
+
+    def flush_sack(self, now_ms: int):
+        """
+        Send one SACK covering every data packet handled since the last
+        flush, if it is urgent or has been held for SACK_DELAY_MS.
+        Called by the IO loop after each receive batch and when idle.
+        """
+        if self._sack_addr is None:
+            return
+        if self._sack_urgent or time_to_deadline_ms(now_ms, self.sack_due_ms) == 0:
+            self._send_owed_sack()
+
+    def _send_owed_sack(self):
+        self._send_sack(self._sack_addr)
+        self._sack_addr = None
+        self._sack_urgent = False
+        self.sack_due_ms = None
+
+    def _owe_sack(self, sender_addr, urgent: bool, now_ms: int):
+        """
+        Note that sender_addr is owed a SACK; it acknowledges everything
+        received so far, whenever it goes out. Delivery progress (the
+        sender's window can slide) and duplicates (our last SACK was lost)
+        are urgent. Out-of-order arrivals are coalesced for SACK_DELAY_MS.
+        """
+        if self._sack_addr is not None and self._sack_addr != sender_addr:
+            self._send_owed_sack()
+        if self._sack_addr is None:
+            self.sack_due_ms = make_deadline_ms(now_ms, SACK_DELAY_MS)
+        self._sack_addr = sender_addr
+        if urgent:
+            self._sack_urgent = True
 
     def _compute_skip_timeout_ms(self) -> int:
         if self.iat_ewma_ms <= 0:
@@ -130,76 +218,98 @@ class Receiver:
         else:
             est = SKIP_K * self.iat_ewma_ms
         self.skip_time = max(MIN_SKIP_MS, min(int(est), MAX_SKIP_MS))
-        # print(f"Current skip is {ret}.")
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("API (Receiver) Current skip is %d ms.", self.skip_time)
 
     # ----------------------------------------------------------------------
     # Reliable data handler
     # ----------------------------------------------------------------------
-    def handle_reliable(self, packet: bytes, sender_addr):
+    def handle_reliable(self, seq: int, ts_ms: int, payload, sender_addr):
         """
-        Process an incoming reliable data packet.
+        Process an incoming reliable data packet (header already parsed).
         Performs buffering, ordered delivery, and sets a skip deadline if needed.
+        payload is a memoryview; it is only materialized with bytes() once
+        the packet is known to be kept, so duplicates and packets outside
+        the window are dropped without a copy.
         """
-        chan, seq, ts_ms, payload = unpack_header(packet)
-
-        # ignore non-reliable packets
-        if chan != DATA_CHANNEL:
-            return
-
+        # Sample the clock once for IAT and deadlines below
+        now = now_ms32()
         if self.last_arrival_ms is not None:
-            iat = calc_latency_ms(self.last_arrival_ms)
+            iat = (now - self.last_arrival_ms) & 0xFFFFFFFF
             self.iat_ewma_ms = iat if self.iat_ewma_ms <= 0 else (1.0 - IAT_ALPHA) * self.iat_ewma_ms + IAT_ALPHA * float(iat)
-        self.last_arrival_ms = now_ms32()
+        self.last_arrival_ms = now
 
+        nxt = self.next_expected_seq_num
+        pool = self._pool
 
         # ignore packets that are already cumulatively ACKed (old duplicates)
-        if is_seq_less_than(seq, self.next_expected_seq_num):
+        # and packets beyond the ring; the sender will retransmit the latter.
+        # Both land at a wrapped distance of RECV_WIN or more from nxt.
+        if ((seq - nxt) & SEQ_MASK) >= RECV_WIN:
+            if pool is not None:
+                pool.release(payload)
+            # Still ACK: a duplicate means our last SACK was lost, and
+            # without a fresh one the sender retransmits it forever.
+            self._owe_sack(sender_addr, True, now)
             return
 
-        # Store the packet in the reordering buffer (if not already present)
-        if seq not in self.receive_buffer:
-            self.receive_buffer[seq] = (payload, ts_ms)
-
-        # Attempt in-order delivery of buffered data
-        self._try_deliver_from_buffer()
-
-        # --- Generate and send SACK immediately (even if duplicate) ---
-        # This SACK acknowledges everything received so far.
-        self._send_sack(sender_addr)
-
-        # If there is still a missing sequence number (gap),
-        # set a skip deadline if one does not already exist.
-        # self.skip_deadline_ms = set_skip_deadline_if_needed(
-        #     self.receive_buffer,
-        #     self.next_expected_seq_num,
-        #     self.skip_deadline_ms,
-        #     now_ms32(),
-        # )
-        if self.receive_buffer and self.next_expected_seq_num not in self.receive_buffer:
+        duplicate = False
+        if seq == nxt and not self.recv_count and self.delivery_queue.space():
+            # Fast path: in order with nothing buffered, so skip the ring
+            self.delivery_queue.put((seq, ts_ms, payload if pool is not None else bytes(payload)))
+            self.next_expected_seq_num = (seq + 1) & SEQ_MASK
+        else:
+            # Store the packet in the reordering buffer (if not already present)
+            idx = seq & RECV_MASK
+            if not self.recv_present[idx]:
+                self.recv_payloads[idx] = payload if pool is not None else bytes(payload)
+                self.recv_ts[idx] = ts_ms
+                self.recv_present[idx] = 1
+                self.recv_count += 1
+                self._sack_insert(seq)
+            else:
+                duplicate = True
+                if pool is not None:
+                    pool.release(payload)
+
+            # Attempt in-order delivery of buffered data
+            self._try_deliver_from_buffer()
+            if self.recv_present[self.next_expected_seq_num & RECV_MASK]:
+                # In order, but the delivery ring is full: hold it (unACKed
+                # past cum_ack) rather than drop data the peer thinks is safe
+                if self._held_peer is None:
+                    LOG.warning("API (Receiver) delivery ring full; holding reliable data at seq=%d",
+                                self.next_expected_seq_num)
+                self._held_peer = sender_addr
+            elif self._held_peer is not None:
+                self._held_peer = None
+
+        # --- Owe the peer a SACK (even if duplicate) ---
+        self._owe_sack(sender_addr, duplicate or self.next_expected_seq_num != nxt, now)
+
+        # If there is still a missing sequence number (gap), set a skip
+        # deadline if one does not already exist (set_skip_deadline_if_needed,
+        # inlined), or pull it in if the adaptive skip time has shrunk.
+        if self.recv_count and not self.recv_present[self.next_expected_seq_num & RECV_MASK]:
             self._compute_skip_timeout_ms()
             if self.skip_deadline_ms is None:
-                self.skip_deadline_ms = make_deadline_ms(now_ms32(), self.skip_time)
+                self.skip_deadline_ms = make_deadline_ms(now, self.skip_time)
             else:
-                remain = time_to_deadline_ms(now_ms32(), self.skip_deadline_ms)
+                remain = time_to_deadline_ms(now, self.skip_deadline_ms)
                 if remain is not None and self.skip_time < remain:
-                    self.skip_deadline_ms = make_deadline_ms(now_ms32(), self.skip_time)
+                    self.skip_deadline_ms = make_deadline_ms(now, self.skip_time)
         else:
             self.skip_deadline_ms = None
 
     # ----------------------------------------------------------------------
     # Unreliable data handler
     # ----------------------------------------------------------------------
-    def handle_unreliable(self, packet: bytes):
+    def handle_unreliable(self, _seq: int, ts_ms: int, payload, _sender_addr=None):
         """
-        Process an incoming unreliable packet.
+        Process an incoming unreliable packet (header already parsed).
         These are passed directly to the application layer without buffering.
         """
-        chan, _, ts_ms, payload = unpack_header(packet)
-        if chan != UNREL_CHANNEL:
-            return
-
-        latency = calc_latency_ms(ts_ms)
-        self.delivery_queue.put((None, ts_ms, payload, latency))
+        self.delivery_queue.put((None, ts_ms, payload if self._pool is not None else bytes(payload)))
 
     # ----------------------------------------------------------------------
     # Idle timer handler (called on socket timeout)
@@ -213,17 +323,31 @@ class Receiver:
         so that later packets can be delivered immediately.
         """
 
-        if not self.receive_buffer:
+        if not self.recv_count:
             self.skip_deadline_ms = None # No data, clear deadline
             return
 
+        if self._held_peer is not None:
+            # Delivery was held back on a full ring; move what now fits
+            nxt = self.next_expected_seq_num
+            self._try_deliver_from_buffer()
+            if self.next_expected_seq_num != nxt:
+                self._owe_sack(self._held_peer, True, now_ms)
+            if not self.recv_present[self.next_expected_seq_num & RECV_MASK]:
+                self._held_peer = None
+                if self.skip_deadline_ms is None:
+                    self.skip_deadline_ms = clear_or_reset_deadline(
+                        self.recv_present, self.recv_count, self.next_expected_seq_num, now_ms, self.skip_time
+                    )
+
         ttd = time_to_deadline_ms(now_ms, self.skip_deadline_ms)
 
         if ttd is not None and ttd <= 0:
             # Timeout expired!
-            if self.next_expected_seq_num not in self.receive_buffer:
+            if not self.recv_present[self.next_expected_seq_num & RECV_MASK]:
                 missing = self.next_expected_seq_num
-                print(f"API (Receiver) Skip timeout reached, skipping missing seq={missing}")
+                if LOG.isEnabledFor(logging.DEBUG):
+                    LOG.debug("API (Receiver) Skip timeout reached, skipping missing seq=%d", missing)
 
                 # Advance to the next expected sequence number
                 self.next_expected_seq_num = seq_inc(self.next_expected_seq_num)
@@ -233,14 +357,10 @@ class Receiver:
                 self._try_deliver_from_buffer()
 
                 # If another gap remains, reset a new skip deadline
-                # self.skip_deadline_ms = clear_or_reset_deadline(
-                #     self.receive_buffer, self.next_expected_seq_num, now_ms
-                # )
-                if self.receive_buffer and self.next_expected_seq_num not in self.receive_buffer:
-                    self._compute_skip_timeout_ms()
-                    self.skip_deadline_ms = make_deadline_ms(now_ms, self.skip_time)
-                else:
-                    self.skip_deadline_ms = None
+                self._compute_skip_timeout_ms()
+                self.skip_deadline_ms = clear_or_reset_deadline(
+                    self.recv_present, self.recv_count, self.next_expected_seq_num, now_ms, self.skip_time
+                )
             else:
                 # Deadline expired but the packet IS in the buffer.
                 # This shouldn't happen if _try_deliver_from_buffer is correct.
@@ -1,41 +1,97 @@
-import socket
-import struct
+import heapq
+import itertools
+import logging
 import threading
+import time
 from collections import deque
 
 from .utils import *
+from .batch_io import BatchSender, BufferPool
 
 class Sender:
     """
     Sender side for the reliable/unreliable hybrid protocol.
     """
 
-    def __init__(self, sock, remote_addr, lock, snd_win: int = 512):
+    def __init__(self, sock, remote_addr, lock, snd_win: int = 512, connected: bool = False,
+                 gso: bool = False):
         self.sock = sock
-        self.remote_addr = remote_addr
+        self.remote_addr = remote_addr        # numeric (ip, port), resolved by the caller
         self.lock = lock
 
         # --- Reliable sending state ---
         self.seq_num = 0                      # next sequence number to use (16-bit)
         self.base_seq = 0                     # lowest unACKed sequence number (window start)
-        self.send_buffer = {}                 # seq -> (packet_bytes, timer)
         self.SND_WIN = snd_win                # max in-flight reliable packets
+        # In-flight packets as parallel arrays indexed by seq & snd_mask.
+        # At most SND_WIN seqs are in flight, so a slot never holds two.
+        ring = 1 << (snd_win - 1).bit_length()  # round up to a power of two
+        self.snd_mask = ring - 1
+        self.snd_pkts = [None] * ring         # idx -> packet view (pooled buffer)
+        self.snd_rtx = [0] * ring             # idx -> retransmissions so far
+        self.snd_gen = [0] * ring             # idx -> generation of the live deadline
+        self.snd_alive = bytearray(ring)      # idx -> 1 while unACKed
         # inflight is now calculated as (seq_num - base_seq)
         # self.inflight = 0                     # current in-flight reliable packets
-        self.pending_q = deque()              # queued payloads waiting for window
+        # Payloads waiting for window: a bounded ring read at pq_head and
+        # written at pq_tail (free-running counters, capacity a power of two)
+        self.pending_q = [None] * (4 * ring)
+        self.pq_mask = len(self.pending_q) - 1
+        self.pq_head = 0
+        self.pq_tail = 0
 
         # --- Unreliable channel state ---
-        self.useq = 0                         # 16-bit seq for unreliable packets
+        # Unreliable seqs, masked to 16 bits on use. next() on a count is a
+        # single C call, so send_unreliable needs no lock to take one.
+        self._useq_iter = itertools.count()
 
         # --- RTO Adaptive State (Industry Standard) ---
         self.SRTT = RDT_TIMEOUT_MS                          # Smoothed RTT 
         self.RTTVAR = max(int(RDT_TIMEOUT_MS / 2), 50)      # RTT Variance Estimator
         self.RTO = min(max(2 * self.SRTT, self.SRTT + RTO_K_FACTOR * self.RTTVAR), 
                        RTO_MAX)                             # Current RTO
-        self.rtx_cnt = 0
-        self._last_send_ms = 0
-
-        print(f"API (Sender) bound to {self.sock.getsockname()}, sending to {self.remote_addr}")
+        self.rtx_cnt = 0                      # retransmissions so far, all seqs
+        # Egress token bucket, touched by the writer thread only
+        self._tokens = float(PACE_BURST)
+        self._tokens_ts = time.monotonic()
+
+        # --- Egress queues ---
+        # Reliable packets are queued in _tx_q (retransmits at the front,
+        # first sends at the back) and paced; unreliable ones in _unrel_q,
+        # which is never held up by them. The writer thread ships both, up
+        # to TX_BATCH_SIZE per sendmmsg. Producers kick the writer once per
+        # operation, so a lone packet goes out at once and bursts leave
+        # together, without the syscall (or pacing) ever running under self.lock.
+        self._tx_q = deque()
+        self._unrel_q = deque()
+        # Packets are built in pooled buffers. A buffer goes back to the pool
+        # by queueing the bare bytearray behind its packet views: the writer
+        # releases it only once every earlier send of it has gone out.
+        self._pkt_pool = BufferPool(TX_POOL_SLOT_SIZE, 2 * snd_win)
+        self._pack_hdr_into = HDR_STRUCT.pack_into
+        self._tx_wake = threading.Event()
+        self._tx_stopped = False
+        self._closed = False                  # set by cancel_all; no new sends after it
+        self._batch_tx = BatchSender(sock, TX_BATCH_SIZE, connected=connected, gso=gso)
+        self._tx_thread = threading.Thread(target=self._tx_loop, daemon=True)
+        self._tx_thread.start()
+
+        # --- Retransmission scheduler ---
+        # One thread serves every deadline from a heap of (deadline, seq, gen),
+        # guarded by self.lock. Re-arming a slot bumps snd_gen, so superseded
+        # entries are skipped when they surface instead of being removed.
+        self._rtx_heap = []
+        # Deadlines are in RTO units on a clock that ticks once per RTO. An RTO
+        # change only changes the tick rate, which rescales the remaining time
+        # of every pending deadline at once, without re-keying the heap.
+        self._rto_clock = 0.0
+        self._rto_clock_ts = time.monotonic()
+        self._rtx_cv = threading.Condition(self.lock)
+        self._rtx_stopped = False
+        self._rtx_thread = threading.Thread(target=self._rtx_loop, daemon=True)
+        self._rtx_thread.start()
+
+        LOG.info("API (Sender) bound to %s, sending to %s", self.sock.getsockname(), self.remote_addr)
 
     # ----------------------------------------------------------------------
     # Public API
@@ -45,46 +101,66 @@ class Sender:
         Public method to send reliable data.
         If the window is full, the payload is queued and will be sent
         automatically when ACKs arrive and free up space.
+        Raises OverflowError if that queue is full too (the peer has
+        stopped ACKing), instead of letting the backlog grow without bound.
         """
         with self.lock:
+            if self._closed:
+                raise RuntimeError("sender is closed")
             # Calculate current inflight packets
             inflight = (self.seq_num - self.base_seq) & SEQ_MASK
 
             if inflight >= self.SND_WIN:
                 # Window is full
-                self.pending_q.append(data)
-            else:
-                self._send_one_reliable_locked(data)
+                tail = self.pq_tail
+                if tail - self.pq_head > self.pq_mask:
+                    raise OverflowError("sender backlog full")
+                self.pending_q[tail & self.pq_mask] = data
+                self.pq_tail = tail + 1
+                return
+            self._send_one_reliable_locked(data, now_ms32())
+        self._kick_tx()
 
     def send_unreliable(self, data: bytes):
         """
-        Best-effort delivery; immediately send and bump the unreliable seq.
+        Best-effort delivery; immediately queue with the next unreliable seq.
+        Shares no state with the reliable channel, so it runs without
+        self.lock: the seq comes from a count and deque.append is atomic.
         """
-        with self.lock:
-            timestamp = now_ms32()
-            packet = pack_header(UNREL_CHANNEL, self.useq, timestamp) + data
-            try:
-                self.sock.sendto(packet, self.remote_addr)
-            except Exception as e:
-                print(f"API (Sender) unreliable send error: {e}")
-            self.useq = seq_inc(self.useq)
+        if self._closed:
+            raise RuntimeError("sender is closed")
+        useq = next(self._useq_iter) & SEQ_MASK
+        pkt = self._build_packet(UNREL_CHANNEL, useq, now_ms32(), data)
+        q = self._unrel_q
+        q.append(pkt)
+        q.append(pkt.obj)  # sent once, then back to the pool
+        self._kick_tx()
 
     # ----------------------------------------------------------------------
     # SACK handling
     # ----------------------------------------------------------------------
-    def _mark_acked_and_cleanup(self, seq_num: int):
-        """Helper to remove seq_num from buffer and cancel its timer."""
-        entry = self.send_buffer.pop(seq_num, None)
-        if entry is not None:
-            _packet, timer = entry
-            timer.cancel()
-            # print(f"API (Sender) ACKed {seq_num}")
-            return True
-        return False
-
-    def _update_rto(self, rtt_sample: int):
+    def _ack_range_locked(self, first: int, count: int):
+        """
+        Free the slots of count consecutive seqs starting at first, which
+        must lie in [base_seq, seq_num). Heap entries are left in place:
+        when they surface, _retransmit_locked sees the dead slot and skips.
+        """
+        alive = self.snd_alive
+        pkts = self.snd_pkts
+        mask = self.snd_mask
+        free = self._tx_q.append
+        for seq in range(first, first + count):
+            idx = seq & mask
+            if alive[idx]:
+                alive[idx] = 0
+                # Return the buffer via the egress queue, behind any queued retransmit
+                free(pkts[idx].obj)
+                pkts[idx] = None
+
+    def _update_rto(self, rtt_sample: int, now: float):
         """
         Updates SRTT and RTO using Jacobson's simplified algorithm (EWMA).
+        now is the caller's time.monotonic() reading.
         """
         # TCP standard alpha (0.125) and beta (0.25)
         ALPHA = 0.125
@@ -102,134 +178,313 @@ class Sender:
         # 3. Calculate RTO: SRTT + K * RTTVAR, applying bounds
         new_rto = self.SRTT + K * self.RTTVAR
         
-        self.RTO = max(2 * self.SRTT, new_rto) 
-        self.RTO = min(RTO_MAX, self.RTO) # Apply max bound
-        # print(f"Current rto is {self.RTO}.")
-
-        if abs(self.RTO - old_rto) >= max(50, int(old_rto * 0.5)):
-            for seq, (packet, timer) in list(self.send_buffer.items()):
-                timer.cancel()
-                t = threading.Timer(self.RTO / 1000, self._retransmit_handler, args=[seq, 0])
-                self.send_buffer[seq] = (packet, t)
-                t.start()
-
-    def _maybe_pace_locked(self):
-        now = now_ms32()
-        gap = now - self._last_send_ms
-        if gap < 1:  # 1ms
-            time.sleep((1 - gap) / 1000.0)
-        self._last_send_ms = now
-
-    def handle_sack(self, packet: bytes):
-        """
-        (Sender-side) A SACK came in.
-        Processes cumulative ACK and SACK blocks.
-        """
-        # Unpack SACK payload
-        chan, _, tm_ms, sack_payload = unpack_header(packet)
-        if chan != ACK_CHANNEL:
+        new_rto = max(2 * self.SRTT, new_rto)
+        new_rto = min(RTO_MAX, max(RTO_MIN, new_rto)) # Apply bounds
+        if new_rto == old_rto:
             return
-        
-        rtt = calc_latency_ms(tm_ms)
-        self._update_rto(rtt)
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("API (Sender) Current rto is %d ms (was %d).", new_rto, old_rto)
+
+        # Bank the time elapsed at the old rate before switching to the new one
+        self._rto_clock = self._rto_now(now)
+        self._rto_clock_ts = now
+        self.RTO = new_rto
+
+        if abs(new_rto - old_rto) >= max(50, int(old_rto * 0.5)):
+            # Every in-flight deadline moved; let the scheduler recompute its wait
+            self._rtx_cv.notify()
 
-        try:
-            cum_ack, sack_blocks = unpack_sack(sack_payload)
-        except Exception as e:
-            print(f"API (Sender) SACK unpack error: {e}")
+    def _take_tokens(self, want: int) -> int:
+        """
+        (Writer thread) Refill the pacing bucket and take up to want tokens,
+        one per reliable packet; 0 if none is due yet.
+        """
+        now = time.monotonic()
+        tokens = min(PACE_BURST, self._tokens + (now - self._tokens_ts) * PACE_RATE_PPS)
+        self._tokens_ts = now
+        n = min(want, int(tokens))
+        self._tokens = tokens - n
+        return n
+
+    def handle_sacks(self, acks):
+        """
+        (Sender-side) Process every (tm_ms, sack_payload) of one receive
+        batch, in arrival order, under a single lock acquisition.
+        """
+        # One clock read serves the whole batch: RTT samples, RTO and new sends
+        now_ns = time.monotonic_ns()
+        now_ms = now_ms32_cached(now_ns)
+        now = now_ns / 1e9
+        parsed = []
+        for tm_ms, sack_payload in acks:
+            try:
+                cum_ack, sack_blocks = unpack_sack(sack_payload)
+            except Exception as e:
+                LOG.warning("API (Sender) SACK unpack error: %s", e)
+                continue
+            parsed.append(((now_ms - tm_ms) & 0xFFFFFFFF, cum_ack, sack_blocks))
+        if not parsed:
             return
 
         with self.lock:
-            # 1. Process Cumulative ACK
-            # Move the base_seq forward up to the cum_ack
-            while is_seq_less_than(self.base_seq, cum_ack):
-                self._mark_acked_and_cleanup(self.base_seq)
-                self.base_seq = seq_inc(self.base_seq)
-
-            # 2. Process SACK Blocks (Selective ACKs)
-            for start, end in sack_blocks:
-                curr = start
-                # Iterate from start up to and including end sequence
-                while is_seq_in_range(curr, start, end):
-                    self._mark_acked_and_cleanup(curr)
-                    if curr == end:
-                        break
-                    curr = seq_inc(curr)
-
-            # 3. Try to fill the window with queued payloads
-            inflight = (self.seq_num - self.base_seq) & SEQ_MASK
-            while self.pending_q and inflight < self.SND_WIN:
-                payload = self.pending_q.popleft()
-                self._send_one_reliable_locked(payload)
-                inflight = (self.seq_num - self.base_seq) & SEQ_MASK
+            for rtt, cum_ack, sack_blocks in parsed:
+                # RTO update rescales every in-flight deadline, so it runs
+                # under the same lock as the rest of the sender state.
+                self._update_rto(rtt, now)
+
+                # Distances from base_seq replace the wrap-aware seq helpers;
+                # anything outside [base_seq, seq_num) is stale and ignored, so
+                # an old SACK cannot free a slot reused by a newer seq.
+                base = self.base_seq
+                inflight = (self.seq_num - base) & SEQ_MASK
+
+                # 1. Process Cumulative ACK
+                # Move the base_seq forward up to the cum_ack
+                acked = (cum_ack - base) & SEQ_MASK
+                if acked < 0x8000:
+                    acked = min(acked, inflight)
+                    self._ack_range_locked(base, acked)
+                    base = (base + acked) & SEQ_MASK
+                    inflight -= acked
+                    self.base_seq = base
+
+                # 2. Process SACK Blocks (Selective ACKs), [start, end] inclusive
+                for start, end in sack_blocks:
+                    lo = (start - base) & SEQ_MASK
+                    hi = (end - base) & SEQ_MASK
+                    if lo > hi:
+                        lo = 0       # block began before base_seq (already ACKed)
+                    if lo < inflight:
+                        self._ack_range_locked(base + lo, min(hi + 1, inflight) - lo)
+
+            # 3. Fill the freed window with queued payloads in one go; the
+            # writer thread sends (and paces) them after the lock is dropped
+            head = self.pq_head
+            n = min(self.pq_tail - head, self.SND_WIN - inflight)
+            if n > 0:
+                pending = self.pending_q
+                mask = self.pq_mask
+                send_one = self._send_one_reliable_locked
+                for i in range(head, head + n):
+                    send_one(pending[i & mask], now_ms)
+                    pending[i & mask] = None
+                self.pq_head = head + n
+        self._kick_tx()
 
 
     # ----------------------------------------------------------------------
     # Internal helpers (require self.lock held)
     # ----------------------------------------------------------------------
-    def _send_one_reliable_locked(self, data: bytes):
+    def _kick_tx(self):
+        """Wake the writer thread; safe with or without self.lock held."""
+        if not self._tx_wake.is_set():
+            self._tx_wake.set()
+
+    def _tx_loop(self):
+        """
+        Writer thread: drain both egress queues in sendmmsg batches, then
+        sleep until the next kick. Unreliable packets go out as soon as they
+        are queued; reliable ones (first sends and retransmits) no faster
+        than the token bucket allows, and while waiting for a token the
+        writer still wakes for unreliable sends. The wakeup is cleared
+        before draining, so a packet queued at any point is seen by this
+        round or the next.
+        Once stopped, it exits only after both queues have been drained.
         """
-        Build and send a single reliable packet under window budget.
+        q = self._tx_q
+        uq = self._unrel_q
+        wake = self._tx_wake
+        release = self._pkt_pool.release
+        batch = []
+        freed = []
+        timeout = None      # set while reliable packets wait for a token
+        while True:
+            wake.wait(timeout)
+            wake.clear()
+            timeout = None
+            while q or uq:
+                # A bare bytearray is a buffer handed back for reuse
+                while uq and len(batch) < TX_BATCH_SIZE:
+                    item = uq.popleft()
+                    if type(item) is bytearray:
+                        freed.append(item)
+                    else:
+                        batch.append(item)
+                # Fill the rest with as many reliable packets as there are tokens
+                paced = self._take_tokens(TX_BATCH_SIZE - len(batch)) if q else 0
+                sent = []   # reliable packets of this batch, to arm once sent
+                while q and len(batch) < TX_BATCH_SIZE:
+                    item = q[0]
+                    if type(item) is bytearray:
+                        freed.append(q.popleft())
+                        continue
+                    if not paced:
+                        break
+                    paced -= 1
+                    sent.append(item)
+                    batch.append(q.popleft())
+                self._tokens += paced  # hand back what went unused
+                if batch:
+                    try:
+                        self._batch_tx.send_batch(batch, self.remote_addr)
+                    except Exception as e:
+                        LOG.warning("API (Sender) send error (%d pkts): %s", len(batch), e)
+                    batch.clear()
+                if sent:
+                    self._arm_sent(sent)
+                # Only now is no queued view of these buffers left to send
+                for buf in freed:
+                    release(buf)
+                freed.clear()
+                if q and not uq and self._tokens < 1:
+                    # Sleep until the next token is due, unless kicked sooner
+                    timeout = (1 - self._tokens) / PACE_RATE_PPS
+                    break
+            if self._tx_stopped and not q and not uq:
+                return
+
+    def _build_packet(self, chan: int, seq: int, ts_ms: int, data) -> memoryview:
+        """Header + data written into a pooled buffer; returns a view of the packet."""
+        n = HEADER_SIZE + len(data)
+        buf = self._pkt_pool.acquire() if n <= TX_POOL_SLOT_SIZE else bytearray(n)
+        self._pack_hdr_into(buf, 0, chan, seq, ts_ms)
+        buf[HEADER_SIZE:n] = data
+        return memoryview(buf)[:n]
+
+    def _send_one_reliable_locked(self, data: bytes, timestamp: int):
+        """
+        Build a single reliable packet under window budget and queue it
+        for the writer thread; the caller kicks it. Its retransmission
+        deadline starts once the writer has sent it (_arm_sent).
+        timestamp (header ms) comes from one clock sample the caller
+        takes, once per send or per backlog drain.
         Precondition: self.lock is held and self.inflight < self.SND_WIN.
         """
         seq = self.seq_num
-        timestamp = now_ms32()
-        pkt = pack_header(DATA_CHANNEL, seq, timestamp) + data
-        self._maybe_pace_locked()
-
-        # Send the packet
-        try:
-            self.sock.sendto(pkt, self.remote_addr)
-        except Exception as e:
-            print(f"API (Sender) reliable send error (seq={seq}): {e}")
-
-        # Start per-packet retransmission timer
-        rtx_cnt = 0
-        t = threading.Timer(self.RTO / 1000, self._retransmit_handler, args=[seq, rtx_cnt])
-        self.send_buffer[seq] = (pkt, t)
-        t.start()
+        pkt = self._build_packet(DATA_CHANNEL, seq, timestamp, data)
+        self._tx_q.append(pkt)
+
+        idx = seq & self.snd_mask
+        self.snd_pkts[idx] = pkt
+        self.snd_rtx[idx] = 0
+        self.snd_gen[idx] += 1   # retire any deadline the slot's previous seq left behind
+        self.snd_alive[idx] = 1
 
         # Advance reliable sequence
-        self.seq_num = seq_inc(self.seq_num)
+        self.seq_num = (seq + 1) & SEQ_MASK
 
 
-    def _retransmit_handler(self, seq_num: int, rtx_cnt: int):
+    def _rto_now(self, now: float) -> float:
+        """Reading of the RTO-unit clock at monotonic time now."""
+        return self._rto_clock + (now - self._rto_clock_ts) * 1000 / self.RTO
+
+    def _arm_locked(self, seq: int, rtos: float, now: float):
+        """
+        (Re)start seq's retransmission deadline rtos RTOs after now (an
+        _rto_now() reading), superseding any older one.
         """
-        Called by a timer when a SACK wasn't received for this packet.
+        idx = seq & self.snd_mask
+        gen = self.snd_gen[idx] + 1
+        self.snd_gen[idx] = gen
+        deadline = now + rtos
+        heap = self._rtx_heap
+        # Only wake the scheduler if this became the earliest deadline
+        earliest = not heap or deadline < heap[0][0]
+        heapq.heappush(heap, (deadline, seq, gen))
+        if earliest:
+            self._rtx_cv.notify()
+
+    def _arm_sent(self, pkts: list):
         """
+        (Writer thread) Start the retransmission deadlines of reliable
+        packets that have just gone out, so time spent queued behind the
+        pacer never counts against the RTO. A first send waits one RTO,
+        the n-th retransmit 2**n (capped at RTO_MAX). Packets ACKed while
+        queued, or whose slot was since reused, are skipped.
+        """
+        mask = self.snd_mask
+        snd_pkts = self.snd_pkts
+        snd_rtx = self.snd_rtx
         with self.lock:
-            # Use .get() to avoid race conditions if SACK arrived just after timer fired
-            entry = self.send_buffer.get(seq_num)
-            if entry is None:
-                return  # already ACKed by SACK
-
-            # Retransmit un-ACKed packet.
-            print(f"API (Sender) RETRANSMIT: Seq {seq_num} timed out. Resending.")
-            packet, _old_timer = entry
-
-            try:
-                self.sock.sendto(packet, self.remote_addr)
-            except Exception as e:
-                print(f"API (Sender) retransmit error: {e}")
-
-            # Start a new timer.
-            rtx_cnt += 1
-            new_timer = threading.Timer(min(self.RTO * 2**rtx_cnt, RTO_MAX) / 1000, self._retransmit_handler, args=[seq_num, rtx_cnt])
-            self.send_buffer[seq_num] = (packet, new_timer)
-            new_timer.start()
+            now = self._rto_now(time.monotonic())
+            for pkt in pkts:
+                seq = (pkt[1] << 8) | pkt[2]
+                idx = seq & mask
+                if snd_pkts[idx] is not pkt:
+                    continue
+                rtx_cnt = snd_rtx[idx]
+                self._arm_locked(seq, min(2**rtx_cnt, RTO_MAX / self.RTO) if rtx_cnt else 1.0, now)
+
+    def _retransmit_locked(self, seq_num: int, gen: int):
+        """
+        A deadline expired without a SACK for this packet: return the
+        packet to resend, or None for a stale entry (the packet was ACKed,
+        re-armed, or its slot reused by a newer seq), recognised by its
+        generation. The next deadline starts when the writer resends it.
+        """
+        idx = seq_num & self.snd_mask
+        if gen != self.snd_gen[idx] or not self.snd_alive[idx]:
+            return None  # already ACKed by SACK, or superseded
+
+        # Retransmit un-ACKed packet.
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("API (Sender) RETRANSMIT: Seq %d timed out. Resending.", seq_num)
+        self.rtx_cnt += 1
+        # Bump the backoff and retire the expired deadline; _arm_sent sets the next
+        self.snd_rtx[idx] += 1
+        self.snd_gen[idx] += 1
+        return self.snd_pkts[idx]
+
+    def _rtx_loop(self):
+        """
+        Scheduler thread: fire every expired deadline under self.lock,
+        hand the resulting retransmits to the writer as one burst at the
+        front of the egress queue, ahead of any first-send backlog, then
+        sleep until the earliest remaining deadline (waiting releases the lock).
+        """
+        heap = self._rtx_heap
+        burst = []
+        with self._rtx_cv:
+            while not self._rtx_stopped:
+                now = self._rto_now(time.monotonic())
+                try:
+                    while heap and heap[0][0] <= now:
+                        _deadline, seq, gen = heapq.heappop(heap)
+                        pkt = self._retransmit_locked(seq, gen)
+                        if pkt is not None:
+                            burst.append(pkt)
+                    if burst:
+                        # extendleft reverses, so the burst keeps its seq order
+                        burst.reverse()
+                        self._tx_q.extendleft(burst)
+                        burst.clear()
+                        self._kick_tx()
+                except Exception as e:
+                    LOG.warning("API (Sender) retransmit error: %s", e)
+                self._rtx_cv.wait((heap[0][0] - now) * self.RTO / 1000 if heap else None)
 
     # ----------------------------------------------------------------------
     # Shutdown
     # ----------------------------------------------------------------------
     def cancel_all(self):
         """
-        Close the sender
+        Close the sender: refuse further sends, stop retransmitting, and
+        wait (up to CLOSE_DRAIN_MS) for the writer to ship what is queued.
+        Payloads still waiting for window space are dropped.
         """
         with self.lock:
-            for _seq, (_pkt, t) in self.send_buffer.items():
-                t.cancel()
-            self.send_buffer.clear()
-            self.pending_q.clear()
+            self._closed = True
+            self._rtx_heap.clear()
+            for idx in range(len(self.snd_pkts)):
+                self.snd_pkts[idx] = None
+            self.snd_alive[:] = bytes(len(self.snd_alive))
+            self.pending_q[:] = [None] * len(self.pending_q)
+            self.pq_head = self.pq_tail = 0
             self.seq_num = 0
             self.base_seq = 0
+            self._rtx_stopped = True
+            self._rtx_cv.notify()
+        self._tx_stopped = True
+        self._tx_wake.set()
+        self._tx_thread.join(CLOSE_DRAIN_MS / 1000)
 
@@ -0,0 +1,111 @@
+import threading
+
+from .utils import *
+
+class SPSCRing:
+    """
+    Fixed-capacity single-producer / single-consumer ring buffer.
+
+    The I/O thread is the only producer (put) and the application thread
+    the only consumer (try_pop), so no lock is needed: each index is
+    written by exactly one side, and the slot is filled before the tail
+    is published. Under CPython the GIL makes each int store atomic.
+
+    pop() lets the consumer block instead of polling. The producer only
+    touches the Event while a consumer is actually waiting, so put() stays
+    lock-free on the busy path.
+    """
+
+    def __init__(self, capacity: int = DELIVERY_RING_SIZE):
+        if capacity <= 0 or capacity & (capacity - 1):
+            raise ValueError("SPSCRing capacity must be a power of two")
+        self._buf = [None] * capacity
+        self._mask = capacity - 1
+        self._head = 0      # next slot to read, only advanced by the consumer
+        self._tail = 0      # next slot to write, only advanced by the producer
+        self.dropped = 0    # items rejected because the consumer fell behind (unreliable only;
+                            # the receiver holds reliable data back instead)
+        self._waiting = False           # consumer is (about to be) parked in pop()
+        self._closed = False            # set for good by wake(); pop() no longer blocks
+        self._nonempty = threading.Event()
+
+    def put(self, item) -> bool:
+        """(Producer) Append item. Returns False (and drops it) when full."""
+        tail = self._tail
+        if tail - self._head > self._mask:
+            self.dropped += 1
+            return False
+        self._buf[tail & self._mask] = item
+        self._tail = tail + 1   # publish after the slot is written
+        if self._waiting:
+            self._nonempty.set()
+        return True
+
+    def put_many(self, items: list) -> int:
+        """
+        (Producer) Append items in order with a single publish and at most
+        one wakeup. Returns how many fit; the rest are dropped.
+        """
+        tail = self._tail
+        n = min(len(items), self._mask + 1 - (tail - self._head))
+        buf = self._buf
+        mask = self._mask
+        for i in range(n):
+            buf[(tail + i) & mask] = items[i]
+        self.dropped += len(items) - n
+        self._tail = tail + n   # publish after every slot is written
+        if n and self._waiting:
+            self._nonempty.set()
+        return n
+
+    def try_pop(self):
+        """(Consumer) Remove and return the oldest item, or None if empty."""
+        head = self._head
+        if head == self._tail:
+            return None
+        idx = head & self._mask
+        item = self._buf[idx]
+        self._buf[idx] = None   # drop our reference so the payload can be freed
+        self._head = head + 1
+        return item
+
+    def pop(self, timeout: float | None = None):
+        """
+        (Consumer) Like try_pop, but waits up to timeout seconds (None: no
+        limit) for an item. Returns None on timeout, or at once if empty
+        once wake() has been called.
+        """
+        item = self.try_pop()
+        if item is not None or (timeout is not None and timeout <= 0):
+            return item
+        # Announce the wait, then re-check: a put() that published before
+        # _waiting was seen is caught by the re-check, any later one sets the
+        # Event. wake() sets _closed first, so one that raced the clear() is seen too.
+        self._nonempty.clear()
+        self._waiting = True
+        try:
+            item = self.try_pop()
+            if item is None and not self._closed:
+                self._nonempty.wait(timeout)
+                item = self.try_pop()
+        finally:
+            self._waiting = False
+        return item
+
+    def wake(self):
+        """
+        Release a consumer blocked in pop() (it gets None if still empty),
+        and make every later pop() return without blocking. Called on close.
+        """
+        self._closed = True
+        self._nonempty.set()
+
+    def space(self) -> int:
+        """
+        (Producer) Free slots. The consumer can only add to this, so a put
+        of up to this many items will not drop any.
+        """
+        return self._mask + 1 - (self._tail - self._head)
+
+    def __len__(self):
+        return self._tail - self._head
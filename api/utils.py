@@ -1,27 +1,80 @@
+import logging
+import logging.handlers
+import queue
 import struct
 import time
 
+# Protocol logger. Per-packet messages are DEBUG and guarded with
+# LOG.isEnabledFor(logging.DEBUG) so nothing is formatted when disabled.
+# Until the application configures logging (or calls start_log_listener),
+# only warnings show, on stderr via Python's last-resort handler; INFO
+# messages such as startup and shutdown need the listener.
+LOG = logging.getLogger('rudp')
+
+_log_handler = None   # QueueHandler of the current start_log_listener route
+
+def start_log_listener(level: int = logging.INFO, handler: logging.Handler = None):
+    """
+    Route the 'rudp' logger through a queue: the IO and sender threads only
+    enqueue records, and a QueueListener thread formats and writes them
+    (to stderr unless handler is given). Returns the listener; stop() it
+    on shutdown to flush what is left. Calling it again detaches the
+    previous listener rather than adding a second route, so each record is
+    still written once (the old listener only needs stopping).
+    """
+    global _log_handler
+    if _log_handler is not None:
+        LOG.removeHandler(_log_handler)
+    if handler is None:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+    q = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(q, handler)
+    _log_handler = logging.handlers.QueueHandler(q)
+    LOG.addHandler(_log_handler)
+    LOG.setLevel(level)
+    listener.start()
+    return listener
+
 # --- Header Configuration ---
 # B = Channel Type (1 byte), H = Seq/Ack Num (2 bytes), I = Timestamp (4 bytes)
 HEADER_FORMAT = '!BHI'
-HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+HDR_STRUCT = struct.Struct(HEADER_FORMAT)   # precompiled, avoids per-call format parsing
+HEADER_SIZE = HDR_STRUCT.size
+# Just the timestamp field, for frames whose channel and seq never change
+TS_STRUCT = struct.Struct('!I')
+TS_OFFSET = 3
 
 DATA_CHANNEL = 0x00
 UNREL_CHANNEL = 0x01
 ACK_CHANNEL = 0x02
 
 # SACK Configuration
-MAX_SACK_BLOCKS = 4
-# 2 bytes for Cum ACK + (4 blocks * 4 bytes/block)
-SACK_PAYLOAD_SIZE = 2 + (MAX_SACK_BLOCKS * 4)
-# H for CumAck, followed by 4 pairs of HH (Start/End Seq)
-SACK_FORMAT = f'!H{MAX_SACK_BLOCKS * "HH"}'
+SACK_BITMAP_BITS = 64
+# H for CumAck, H for the bitmap base, Q for the bitmap:
+# bit i set = seq (base + i) was received
+SACK_FORMAT = '!HHQ'
+SACK_STRUCT = struct.Struct(SACK_FORMAT)
+SACK_PAYLOAD_SIZE = SACK_STRUCT.size     # 12 bytes
 
 # Default timeout (in ms) 
 RDT_TIMEOUT_MS = 100
 SKIP_TIMEOUT_MS = 200
 DEFAULT_RECV_TIMEOUT_MS = 10
+SACK_DELAY_MS = 2            # Max time a SACK for out-of-order data is held back to coalesce
+MAX_BATCH_SIZE = 32          # Max datagrams per recvmmsg / sendmmsg call
+TX_BATCH_SIZE = 64           # Max datagrams the sender's writer thread ships per sendmmsg
+RX_POOL_SLOT_SIZE = 2048     # zero_copy receive buffer size (largest accepted datagram)
+RX_POOL_SIZE = 256           # zero_copy receive buffers kept for reuse
+PACE_RATE_PPS = 1000         # Egress token bucket: one token per ms, the 1 pkt/ms pacing...
+PACE_BURST = 4               # ...with at most this many back-to-back after an idle spell
+TX_POOL_SLOT_SIZE = 2048     # Sender packet buffer size; larger packets get their own
+SOCK_RCVBUF = 8 << 20        # Requested kernel buffers (capped by net.core.[rw]mem_max)
+SOCK_SNDBUF = 2 << 20
+SEND_WAIT_MS = 1000          # Max wait for send-buffer room before a send error is reported
 RTO_MAX = 1000               # Max RTO (e.g., 1 seconds)
+CLOSE_DRAIN_MS = 2000        # Max time close() waits for queued packets to go out
+RTO_MIN = 20                 # Min RTO; a near-zero RTT sample must not spin the scheduler
 
 MIN_SKIP_MS = 100
 MAX_SKIP_MS = 2000
@@ -34,10 +87,18 @@ RTO_K_FACTOR = 4             # K factor for RTO calculation (often 4)
 SEQ_MOD  = 1 << 16        # 65536
 SEQ_MASK = SEQ_MOD - 1    # 0xFFFF
 RECV_WIN = 1024            # Receive window size, which can be adjust (< 32768 should be safe)
+RECV_MASK = RECV_WIN - 1   # RECV_WIN must be a power of two (ring index mask)
+DELIVERY_RING_SIZE = 1 << 16   # App delivery ring capacity (power of two)
+
+_mono_ns = time.monotonic_ns   # bound once; now_ms32 is called per packet
 
 def now_ms32() -> int:
-    """ms clock, within 32-bit."""
-    return (time.monotonic_ns() // 1_000_000) & 0xFFFFFFFF
+    """ms clock, within 32-bit (monotonic, integer-only arithmetic)."""
+    return (_mono_ns() // 1_000_000) & 0xFFFFFFFF
+
+def now_ms32_cached(nanos: int) -> int:
+    """now_ms32() from a time.monotonic_ns() reading the caller already took."""
+    return (nanos // 1_000_000) & 0xFFFFFFFF
 
 def calc_latency_ms(recv_time: int) -> int:
     return (now_ms32() - recv_time) & 0xFFFFFFFF
@@ -46,13 +107,16 @@ def seq_inc(x: int) -> int:
     """seq adds 1 (wrapped in 16-bit)."""
     return (x + 1) & SEQ_MASK
 
+# Wrap-aware comparisons are a single masked subtraction, with no branch;
+# hot paths inline that same distance rather than calling these helpers.
 def is_seq_before(a: int, b: int) -> bool:
     """To chech whether a is before b."""
     return ((a - b) & SEQ_MASK) > 0x8000
 
 def is_seq_less_than(a: int, b: int) -> bool:
     """Checks if sequence number 'a' is less than 'b' (respecting wrap-around)."""
-    return (a != b) and ((a - b) & SEQ_MASK) > 0x8000
+    # a == b gives distance 0, so it needs no separate test
+    return ((a - b) & SEQ_MASK) > 0x8000
 
 def is_seq_in_range(seq: int, start: int, end_inclusive: int) -> bool:
     """Checks if seq is in [start, end_inclusive] (respecting wrap-around)."""
@@ -80,18 +144,22 @@ def time_to_deadline_ms(now_ms: int, deadline_ms: int | None) -> int | None:
         return 0
     return delta
 
-def set_skip_deadline_if_needed(buffer: dict, next_expected: int, deadline_ms: int | None, now_ms: int) -> int | None:
+# The skip helpers take the receiver's reordering ring: present[seq & RECV_MASK]
+# is non-zero while seq is buffered, and count is the number of such slots.
+def set_skip_deadline_if_needed(present, count: int, next_expected: int, deadline_ms: int | None,
+                                now_ms: int, after_ms: int = SKIP_TIMEOUT_MS) -> int | None:
     """Set skip deadline if there is a gap and none exists."""
     # Set deadline only if buffer is not empty AND there's a gap
-    if buffer and next_expected not in buffer and deadline_ms is None:
-        return make_deadline_ms(now_ms, SKIP_TIMEOUT_MS)
+    if count and not present[next_expected & RECV_MASK] and deadline_ms is None:
+        return make_deadline_ms(now_ms, after_ms)
     return deadline_ms
 
-def clear_or_reset_deadline(buffer: dict, next_expected: int, now_ms: int) -> int | None:
+def clear_or_reset_deadline(present, count: int, next_expected: int, now_ms: int,
+                            after_ms: int = SKIP_TIMEOUT_MS) -> int | None:
     """Clear or reset skip deadline after delivery/jump."""
     # Reset deadline if a new gap is exposed
-    if buffer and next_expected not in buffer:
-        return make_deadline_ms(now_ms, SKIP_TIMEOUT_MS)
+    if count and not present[next_expected & RECV_MASK]:
+        return make_deadline_ms(now_ms, after_ms)
     return None
 
 # --- I/O timeout calculation (for recvfrom) ---
@@ -104,53 +172,70 @@ def compute_recv_timeout_sec(now_ms: int, deadline_ms: int | None) -> float:
 
 # --- Header packing/unpacking ---
 def pack_header(chan: int, seq: int, ts_ms: int) -> bytes:
-    return struct.pack(HEADER_FORMAT, chan & 0xFF, seq & SEQ_MASK, ts_ms & 0xFFFFFFFF)
+    return HDR_STRUCT.pack(chan & 0xFF, seq & SEQ_MASK, ts_ms & 0xFFFFFFFF)
 
 def unpack_header(pkt: bytes):
-    """Return (chan, seq, ts_ms, payload)."""
-    chan, seq, ts = struct.unpack(HEADER_FORMAT, pkt[:HEADER_SIZE])
+    """
+    Return (chan, seq, ts_ms, payload).
+    payload is a memoryview into pkt (no copy); call bytes() on it
+    before keeping it beyond the lifetime of pkt.
+    """
+    chan, seq, ts = HDR_STRUCT.unpack_from(pkt, 0)
+    # The IO loop already hands us views; slicing one needs no second view
+    if type(pkt) is not memoryview:
+        pkt = memoryview(pkt)
     return chan, seq, ts, pkt[HEADER_SIZE:]
 
 # --- SACK packing/unpacking ---
-def pack_sack(cum_ack: int, sack_blocks: list) -> bytes:
-    """Pack Cumulative ACK and SACK blocks into payload."""
-    data = [cum_ack & SEQ_MASK]
-
-    # Add up to MAX_SACK_BLOCKS
-    for start, end in sack_blocks[:MAX_SACK_BLOCKS]:
-        data.extend([start & SEQ_MASK, end & SEQ_MASK])
-
-    # Pad with zeros if fewer than MAX_SACK_BLOCKS are present
-    padding_needed = MAX_SACK_BLOCKS - len(sack_blocks)
-    data.extend([0, 0] * padding_needed)
-
-    return struct.pack(SACK_FORMAT, *data)
+def sack_bitmap(sack_blocks, base: int) -> int:
+    """
+    Bitmap of the SACK_BITMAP_BITS seqs from base, given (start_seq,
+    end_seq_inclusive) blocks ordered by distance. A block starting before
+    base is clipped to it; one ending before base is dropped.
+    """
+    bitmap = 0
+    for start, end in sack_blocks:
+        off = (start - base) & SEQ_MASK
+        if off >= 0x8000:
+            if ((end - base) & SEQ_MASK) >= 0x8000:
+                continue     # block lies wholly before base
+            off = 0          # block straddles base
+        elif off >= SACK_BITMAP_BITS:
+            break
+        top = min(((end - base) & SEQ_MASK) + 1, SACK_BITMAP_BITS)
+        bitmap |= ((1 << (top - off)) - 1) << off
+    return bitmap
+
+def pack_sack(cum_ack: int, base: int, bitmap: int) -> bytes:
+    """Pack Cumulative ACK and SACK bitmap into payload."""
+    return SACK_STRUCT.pack(cum_ack & SEQ_MASK, base & SEQ_MASK, bitmap & 0xFFFFFFFFFFFFFFFF)
+
+def pack_sack_into(buf, offset: int, cum_ack: int, base: int, bitmap: int):
+    """Same as pack_sack, but writes into buf at offset instead of allocating."""
+    SACK_STRUCT.pack_into(buf, offset, cum_ack & SEQ_MASK, base & SEQ_MASK, bitmap & 0xFFFFFFFFFFFFFFFF)
 
 def unpack_sack(payload: bytes):
-    """Unpack SACK payload into (cum_ack, sack_blocks)."""
+    """
+    Unpack SACK payload into (cum_ack, sack_blocks); the bitmap's runs of
+    set bits come back as (start_seq, end_seq_inclusive) blocks, nearest first.
+    """
     if len(payload) < SACK_PAYLOAD_SIZE:
         # Handle payloads that might be smaller than expected
-        payload += b'\x00' * (SACK_PAYLOAD_SIZE - len(payload))
-
-    unpacked_data = struct.unpack(SACK_FORMAT, payload[:SACK_PAYLOAD_SIZE])
+        payload = bytes(payload) + b'\x00' * (SACK_PAYLOAD_SIZE - len(payload))
 
-    cum_ack = unpacked_data[0]
+    cum_ack, base, bitmap = SACK_STRUCT.unpack_from(payload, 0)
     sack_blocks = []
 
-    # Blocks start at index 1
-    for i in range(MAX_SACK_BLOCKS):
-        start_idx = 1 + (i * 2)
-        start_seq = unpacked_data[start_idx]
-        end_seq = unpacked_data[start_idx + 1]
-
-        # A block of (0, 0) is treated as a null block/padding,
-        # but we must accept (0, 0) if it's the first block (e.g., seq 0 was SACKed)
-        if start_seq == 0 and end_seq == 0 and i > 0:
-             break
-
-        # Basic validation: start must not be after end
-        if is_seq_in_range(start_seq, start_seq, end_seq):
-             sack_blocks.append((start_seq, end_seq))
+    # One step per run, not per bit: skip the zeros below the lowest set
+    # bit, then measure the run of ones that starts there
+    pos = 0
+    while bitmap:
+        gap = (bitmap & -bitmap).bit_length() - 1
+        bitmap >>= gap
+        pos += gap
+        run = (~bitmap & (bitmap + 1)).bit_length() - 1
+        sack_blocks.append(((base + pos) & SEQ_MASK, (base + pos + run - 1) & SEQ_MASK))
+        bitmap >>= run
+        pos += run
 
     return cum_ack, sack_blocks
-
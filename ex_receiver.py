@@ -1,20 +1,52 @@
+import math
 import time
-import json
+import struct
 import sys
-import numpy as np
 from api.ReliableUDP_API import ReliableUDP_API
+from api.utils import start_log_listener
 
 DEFAULT_PORT = 6000
 TEST_DURATION_SEC = 35 # Give 5s buffer for last packets to arrive
 
+# Mock game state layout sent by ex_sender: packet id + padded body
+PAYLOAD = struct.Struct('!I992s')
+
+class LatencyStats:
+    """Running mean/min/max/std-dev (Welford), O(1) memory per sample stream."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    def std(self):
+        # Population std-dev, same as np.std
+        return math.sqrt(self.m2 / self.n) if self.n else 0.0
+
 def main():
-    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    # --verbose prints every arrival; off by default so printing stays off the receive path
+    verbose = '--verbose' in sys.argv
+    args = [a for a in sys.argv[1:] if a != '--verbose']
+    port = int(args[0]) if args else DEFAULT_PORT
+    log_listener = start_log_listener()
     
     print(f"Receiver app starting. Listening on port {port} for {TEST_DURATION_SEC}s...")
     
     api = None
-    reliable_latencies = []
-    unreliable_latencies = []
+    reliable_latencies = LatencyStats()
+    unreliable_latencies = LatencyStats()
     
     total_reliable_recv = 0
     total_unreliable_recv = 0
@@ -24,9 +56,10 @@ def main():
         api = ReliableUDP_API(local_port=port)
         start_time = time.monotonic()
         
-        while time.monotonic() - start_time < TEST_DURATION_SEC:
+        while (remaining := TEST_DURATION_SEC - (time.monotonic() - start_time)) > 0:
             
-            item = api.receive()
+            # Block until a packet arrives (or the test ends) instead of polling
+            item = api.receive(timeout=min(0.25, remaining))
             
             if item:
                 # 1. A receiver application displays the data.
@@ -40,25 +73,22 @@ def main():
                     channel_type = "RELIABLE"
                     seq_num = seq
                     total_reliable_recv += 1
-                    reliable_latencies.append(latency_ms)
+                    reliable_latencies.add(latency_ms)
                 else:
                     # Unreliable packet
                     channel_type = "UNRELIABLE"
                     seq_num = "N/A"
                     total_unreliable_recv += 1
-                    unreliable_latencies.append(latency_ms)
+                    unreliable_latencies.add(latency_ms)
                 
-                try:
-                    data = json.loads(payload.decode('utf-8'))
-                    payload_id = data.get('id', 'N/A')
-                except Exception:
-                    payload_id = "N/A"
+                if verbose:
+                    try:
+                        payload_id, _body = PAYLOAD.unpack_from(payload, 0)
+                    except struct.error:
+                        payload_id = "N/A"
 
-                print(f"[Packet Arrival] Channel: {channel_type:<10} | SeqNo: {str(seq_num):<5} | "
-                      f"PayloadID: {str(payload_id):<5} | Timestamp: {ts_ms:<10} | RTT: {latency_ms:<4} ms")
-            
-            else:
-                time.sleep(0.001)
+                    print(f"[Packet Arrival] Channel: {channel_type:<10} | SeqNo: {str(seq_num):<5} | "
+                          f"PayloadID: {str(payload_id):<5} | Timestamp: {ts_ms:<10} | RTT: {latency_ms:<4} ms")
 
         print("\nTest duration finished.")
 
@@ -69,6 +99,7 @@ def main():
     finally:
         if api:
             api.close()
+        log_listener.stop()
         print("Receiver closed.")
 
     # 3. Mmeasure performance metrics: Latency/Jitter/Throughput
@@ -89,19 +120,19 @@ def main():
     print(f"  Total Received:      {total_reliable_recv + total_unreliable_recv}")
     
     # Latency & Jitter (Std Dev of Latency)
-    if reliable_latencies:
+    if reliable_latencies.n:
         print(f"\nReliable Channel Latency/Jitter:")
-        print(f"  Average: {np.mean(reliable_latencies):.2f} ms")
-        print(f"  Min:     {np.min(reliable_latencies):.2f} ms")
-        print(f"  Max:     {np.max(reliable_latencies):.2f} ms")
-        print(f"  Jitter (StdDev): {np.std(reliable_latencies):.2f} ms")
+        print(f"  Average: {reliable_latencies.mean:.2f} ms")
+        print(f"  Min:     {reliable_latencies.min:.2f} ms")
+        print(f"  Max:     {reliable_latencies.max:.2f} ms")
+        print(f"  Jitter (StdDev): {reliable_latencies.std():.2f} ms")
         
-    if unreliable_latencies:
+    if unreliable_latencies.n:
         print(f"\nUnreliable Channel Latency/Jitter:")
-        print(f"  Average: {np.mean(unreliable_latencies):.2f} ms")
-        print(f"  Min:     {np.min(unreliable_latencies):.2f} ms")
-        print(f"  Max:     {np.max(unreliable_latencies):.2f} ms")
-        print(f"  Jitter (StdDev): {np.std(unreliable_latencies):.2f} ms")
+        print(f"  Average: {unreliable_latencies.mean:.2f} ms")
+        print(f"  Min:     {unreliable_latencies.min:.2f} ms")
+        print(f"  Max:     {unreliable_latencies.max:.2f} ms")
+        print(f"  Jitter (StdDev): {unreliable_latencies.std():.2f} ms")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,8 +1,9 @@
 import time
-import json
 import random
+import struct
 import sys
 from api.ReliableUDP_API import ReliableUDP_API
+from api.utils import start_log_listener
 
 DEFAULT_HOST = '127.0.0.1'
 DEFAULT_PORT = 6000
@@ -11,10 +12,15 @@ PACKET_RATE_PPS = 100  # Packets per second
 TEST_DURATION_SEC = 30 # Duration of the test
 RELIABLE_RATIO = 0.5 # 50% of packets will be reliable
 
+# Mock game state: packet id + padded body (ex_receiver uses the same layout)
+PAYLOAD = struct.Struct('!I992s')
+PAYLOAD_BODY = b'a' * 992
+
 def main():
     host = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_HOST
     port = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_PORT
     local_port = int(sys.argv[3]) if len(sys.argv) > 3 else SENDER_PORT
+    log_listener = start_log_listener()
     
     print(f"Sender app starting. Sending to {host}:{port} for {TEST_DURATION_SEC}s...")
     
@@ -32,13 +38,8 @@ def main():
         while time.monotonic() - start_time < TEST_DURATION_SEC:
             packet_id += 1
             
-            # 1. Create mock game data
-            mock_data = {
-                "id": packet_id,
-                "note": "Mock game state",
-                "payload": "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"
-            }
-            data_bytes = json.dumps(mock_data).encode('utf-8')
+            # 1. Create mock game data: packet id + fixed-size body
+            data_bytes = PAYLOAD.pack(packet_id, PAYLOAD_BODY)
             
             # 2. Tag outgoing data packets as reliable or unreliable randomly
             is_reliable = (random.random() < RELIABLE_RATIO)
@@ -66,6 +67,7 @@ def main():
     finally:
         if api:
             api.close()
+        log_listener.stop()
         print("Sender closed.")
 
 if __name__ == "__main__":
@@ -0,0 +1,28 @@
+import unittest
+
+from api.utils import now_ms32
+from tests.support import ReceiverTestCase
+
+
+class FullRingTest(ReceiverTestCase):
+    ring_size = 4
+
+    def test_reliable_data_held_until_app_reads(self):
+        for seq in range(10):
+            self.recv(seq)
+        self.assertEqual(self.ring.dropped, 0)
+        self.assertEqual(self.rx.next_expected_seq_num, 4)   # cum_ack stops at the full ring
+
+        got = []
+        while len(got) < 10:
+            item = self.ring.try_pop()
+            if item is None:
+                self.rx.on_idle(now_ms32())
+                continue
+            got.append(item[0])
+        self.assertEqual(got, list(range(10)))
+        self.assertEqual(self.rx.next_expected_seq_num, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
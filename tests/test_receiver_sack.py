@@ -0,0 +1,38 @@
+import unittest
+
+from api.utils import sack_bitmap, unpack_sack
+from tests.support import ReceiverTestCase
+
+
+class SackCursorTest(ReceiverTestCase):
+    def blocks(self):
+        base, bitmap = self.rx._get_sack_bitmap()
+        sack = bytes(2) + base.to_bytes(2, 'big') + bitmap.to_bytes(8, 'big')
+        return unpack_sack(sack)[1]
+
+    def test_hole_reported_after_next_expected_passes_cursor(self):
+        for seq in range(1, 301):
+            self.recv(seq)
+        self.blocks()
+        self.blocks()            # cursor now well ahead of next_expected (0)
+        self.recv(0)             # gap heals: next_expected jumps to 301, past the cursor
+        for seq in range(302, 331):
+            self.recv(seq)
+        self.assertEqual(self.blocks(), [(302, 330)])
+
+    def test_hole_reported_after_long_in_order_run(self):
+        self.recv(1)
+        self.blocks()
+        self.recv(0)
+        for seq in range(2, 40000):
+            self.recv(seq)
+            self.blocks()        # one SACK per delivery, as flush_sack sends
+        self.recv(40001)         # 40000 is missing
+        self.assertEqual(self.blocks(), [(40001, 40001)])
+
+    def test_bitmap_drops_blocks_before_base(self):
+        self.assertEqual(sack_bitmap([(10, 20), (98, 101), (103, 103)], 100), 0b1011)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+
+from api.ReliableUDP_API import ReliableUDP_API
+
+
+class LoopbackSenderTest(unittest.TestCase):
+    def setUp(self):
+        self.rx = ReliableUDP_API(0)
+        port = self.rx.sock.getsockname()[1]
+        self.tx = ReliableUDP_API(0, '127.0.0.1', port)
+
+    def tearDown(self):
+        self.tx.close()
+        self.rx.close()
+
+    def test_no_retransmits_without_loss(self):
+        # More than a window (512), so part of it waits in the backlog
+        n = 800
+        for i in range(n):
+            self.tx.send(i.to_bytes(2, 'big'), reliable=True)
+        seqs = []
+        while len(seqs) < n:
+            item = self.rx.receive(timeout=2.0)
+            if item is None:
+                break
+            seqs.append(item[0])
+        self.assertEqual(seqs, list(range(n)))
+        self.assertEqual(self.tx._sender.rtx_cnt, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()